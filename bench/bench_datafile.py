@@ -0,0 +1,146 @@
+"""Benchmarks for storing tables with :py:mod:`cslib.datafile`.
+
+Compares file size and read/write throughput of different storage layouts
+for a DCS-like table. Run as a script, with CSLib installed:
+``python bench/bench_datafile.py [directory]``."""
+
+from timeit import default_timer
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+from cslib import units
+from cslib.datafile import datafile
+from cslib.datafile_collection import datafile_collection
+
+LAYOUTS = [
+    ("contiguous", {}),
+    ("rows", {'chunks': 'rows'}),
+    ("rows + lzf", {'chunks': 'rows', 'compression': 'lzf'}),
+    ("rows + shuffle + lzf",
+     {'chunks': 'rows', 'compression': 'lzf', 'shuffle': True}),
+    ("rows + shuffle + gzip",
+     {'chunks': 'rows', 'compression': 'gzip', 'shuffle': True}),
+    ("h5py auto chunks + gzip", {'chunks': True, 'compression': 'gzip'}),
+]
+
+
+def make_table(n=2000, m=2000):
+    energy = np.logspace(0, 4, n) * units.eV
+    q = np.linspace(0, 10, m) * units('1/nm')
+    # Smooth, physics-like data compresses very differently from noise.
+    cs = 1 / (energy.magnitude[:, None] * (1 + q.magnitude[None, :])**2)
+    return energy, q, cs * units('nm^2 * nm')
+
+
+def bench(directory, n_rows=200):
+    energy, q, cs = make_table()
+    mb = cs.magnitude.nbytes / 2**20
+    rows = np.random.randint(0, len(energy), n_rows)
+
+    print("{:<26} {:>10} {:>12} {:>12} {:>14}".format(
+        "layout", "size (MB)", "write MB/s", "read MB/s", "row reads/s"))
+    for name, kwargs in LAYOUTS:
+        filename = os.path.join(directory, 'bench.h5')
+
+        start = default_timer()
+        with datafile(filename, 'w') as f:
+            group = f.create_group('elastic')
+            group.add_scale('energy', energy)
+            group.add_scale('q', q)
+            group.add_dataset('dcs', cs, ('energy', 'q'), **kwargs)
+        write = default_timer() - start
+        size = os.path.getsize(filename) / 2**20
+
+        with datafile(filename, 'r') as f:
+            group = f.get_group('elastic')
+            start = default_timer()
+            group.get_dataset('dcs')
+            read = default_timer() - start
+
+            dset = group.get_lazy_dataset('dcs')
+            start = default_timer()
+            for i in rows:
+                np.array(dset[i].magnitude)
+            row_reads = n_rows / (default_timer() - start)
+
+        print("{:<26} {:10.1f} {:12.1f} {:12.1f} {:14.0f}".format(
+            name, size, mb / write, mb / read, row_reads))
+        os.remove(filename)
+
+
+def get_property_uncached(f, key):
+    """Property access as it was before datafile cached properties."""
+    value = f.file.attrs[key]
+    return value[0] * units(value[1].decode('ascii'))
+
+
+def bench_properties(directory, n_properties=50, repeat=20):
+    filename = os.path.join(directory, 'properties.h5')
+    with datafile(filename, 'w') as f:
+        for i in range(n_properties):
+            f.set_property('p{}'.format(i), i * units('g/cm^3'))
+
+    for name, get in [
+            ("get_property (uncached)", get_property_uncached),
+            ("get_property", lambda f, key: f.get_property(key))]:
+        start = default_timer()
+        for _ in range(repeat):
+            with datafile(filename, 'r') as f:
+                for i in range(n_properties):
+                    get(f, 'p{}'.format(i))
+        seconds = (default_timer() - start) / repeat
+        print("{:<26} {:10.3f} ms per file ({} properties)".format(
+            name, seconds * 1e3, n_properties))
+    os.remove(filename)
+
+
+def bench_collection(directory, n_files=200):
+    energy, q, cs = make_table(200, 200)
+    filenames = [os.path.join(directory, 'material{}.h5'.format(i))
+                 for i in range(n_files)]
+    for filename in filenames:
+        with datafile(filename, 'w') as f:
+            f.set_property('density', 1.0 * units('g/cm^3'))
+            group = f.create_group('elastic')
+            group.add_scale('energy', energy)
+            group.add_scale('q', q)
+            group.add_dataset('dcs', cs, ('energy', 'q'), chunks=None)
+
+    start = default_timer()
+    for filename in filenames:
+        with datafile(filename, 'r') as f:
+            f.get_property('density')
+            f.get_group('elastic').get_dataset('dcs')
+    print("{:<26} {:10.3f} s ({} files)".format(
+        "one by one", default_timer() - start, n_files))
+
+    start = default_timer()
+    with datafile_collection(filenames) as db:
+        opened = default_timer()
+        db.get_datasets([(filename, 'elastic/dcs')
+                         for filename in filenames])
+        read = default_timer()
+    print("{:<26} {:10.3f} s ({} files)".format(
+        "datafile_collection", read - start, n_files))
+    print("{:<26} {:10.3f} s open and manifest, {:.3f} s read".format(
+        "", opened - start, read - opened))
+
+    for filename in filenames:
+        os.remove(filename)
+
+
+def main(directory):
+    bench(directory)
+    bench_properties(directory)
+    bench_collection(directory)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main(sys.argv[1])
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            main(directory)
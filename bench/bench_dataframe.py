@@ -0,0 +1,102 @@
+"""Benchmarks for :py:class:`cslib.DataFrame`.
+
+Run as a script, with CSLib installed: ``python bench/bench_dataframe.py``."""
+
+from timeit import timeit
+import io
+import os
+import tempfile
+
+import numpy as np
+
+from cslib import (units, DataFrame)
+from cslib.datafile import datafile
+
+
+def multiply_column(df, name):
+    """Column access before columns became views, for comparison."""
+    return df.data[name] * df.unit_dict[name]
+
+
+def bench(n=10**7):
+    data = np.zeros(n, dtype=[('energy', float), ('cs', float),
+                              ('weight', float)])
+    data['energy'] = np.logspace(0, 4, n)
+    rows = DataFrame(data, ['eV', 'nm^2', 'dimensionless'])
+    columns = rows.to_columns()
+
+    print('{} rows'.format(n))
+    t = timeit(lambda: multiply_column(rows, 'energy'), number=5) / 5
+    print('  column, array * unit:         {:8.2f} ms'.format(t * 1e3))
+    for label, df in [('row store', rows), ('column store', columns)]:
+        t = timeit(lambda: df['energy'], number=1000) / 1000
+        print('  column, {:12s} view:     {:8.4f} ms'.format(label, t * 1e3))
+        t = timeit(lambda: df[n // 4:n // 2]['cs'].sum(), number=5) / 5
+        print('  row slice sum, {:12s}    {:8.2f} ms'.format(label, t * 1e3))
+        t = timeit(lambda: df['energy'].to(units.keV), number=5) / 5
+        print('  column in keV, {:12s}    {:8.2f} ms'.format(label, t * 1e3))
+
+
+def bench_text(n=10**6):
+    data = np.zeros(n, dtype=[('energy', float), ('cs', float),
+                              ('weight', float)])
+    data['energy'] = np.logspace(0, 4, n)
+    data['cs'] = np.random.rand(n)
+    text = str(DataFrame(data, ['eV', 'nm^2', 'dimensionless']))
+
+    print('{} rows of text'.format(n))
+    t = timeit(lambda: np.loadtxt(io.StringIO(text)), number=3) / 3
+    print('  np.loadtxt:                   {:8.2f} ms'.format(t * 1e3))
+    for chunk_size in [None, 10**5]:
+        t = timeit(lambda: DataFrame.from_text(
+            io.StringIO(text), chunk_size=chunk_size), number=3) / 3
+        print('  from_text, chunk_size={:8s} {:8.2f} ms'.format(
+            str(chunk_size), t * 1e3))
+
+
+def bench_queries(n=10**7):
+    data = np.zeros(n, dtype=[('material', float), ('energy', float)])
+    data['material'] = np.random.randint(0, 100, n)
+    data['energy'] = np.random.rand(n) * 1e4
+    df = DataFrame(data, ['dimensionless', 'eV'])
+
+    print('{} rows, queries'.format(n))
+    low, high = 1 * units.keV, 2 * units.keV
+    t = timeit(lambda: df[(low <= df['energy']) & (high > df['energy'])],
+               number=3) / 3
+    print('  mask, Quantity comparisons:  {:8.2f} ms'.format(t * 1e3))
+    t = timeit(lambda: df[df.between('energy', low, high)], number=3) / 3
+    print('  mask, between:               {:8.2f} ms'.format(t * 1e3))
+    t = timeit(lambda: df.sort_by('energy'), number=3) / 3
+    print('  sort_by:                     {:8.2f} ms'.format(t * 1e3))
+    t = timeit(lambda: df.groupby('material').mean(), number=3) / 3
+    print('  groupby + mean:              {:8.2f} ms'.format(t * 1e3))
+
+
+def bench_datafile(directory, n=10**6, n_columns=50):
+    data = np.random.rand(n, n_columns).view(
+        [('c{}'.format(i), float) for i in range(n_columns)])[:, 0]
+    df = DataFrame(data, ['eV'] * n_columns)
+    filename = os.path.join(directory, 'frame.h5')
+    with datafile(filename, 'w') as f:
+        df.to_datafile(f.create_group('frame'))
+
+    print('{} rows, {} columns in a datafile'.format(n, n_columns))
+    with datafile(filename, 'r') as f:
+        group = f.get_group('frame')
+        for label, kwargs in [
+                ('all columns', {}),
+                ('two columns', {'columns': ['c0', 'c1']}),
+                ('two columns, 1% of rows',
+                 {'columns': ['c0', 'c1'], 'rows': slice(0, n // 100)})]:
+            t = timeit(lambda: DataFrame.from_datafile(group, **kwargs),
+                       number=3) / 3
+            print('  {:28s} {:8.2f} ms'.format(label, t * 1e3))
+
+
+if __name__ == '__main__':
+    bench()
+    bench_text()
+    bench_queries()
+    with tempfile.TemporaryDirectory() as directory:
+        bench_datafile(directory)
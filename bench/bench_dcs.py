@@ -0,0 +1,101 @@
+"""Benchmarks for evaluating `cslib.DCS` tables.
+
+Run as a script, with CSLib installed: ``python bench/bench_dcs.py``."""
+
+from timeit import timeit
+import tracemalloc
+
+import numpy as np
+
+from cslib import (units, DCS)
+
+
+def make_dcs(n=1000, m=500):
+    energy = np.logspace(0, 4, n) * units.eV
+    q = np.linspace(0, 10, m) * units('1/nm')
+    cs = np.random.random((n, m)) * units('nm^2 * nm')
+    return DCS(energy, q, cs)
+
+
+def report(name, seconds, n_points):
+    print("{:<40} {:10.3f} ms {:10.1f} Mpts/s".format(
+        name, seconds * 1e3, n_points / seconds / 1e6))
+
+
+def bench_call(dcs, n_points=10**6, repeat=5):
+    E = np.random.uniform(1, 1e4, n_points) * units.eV
+    q = np.random.uniform(0, 10, n_points) * units('1/nm')
+    E_raw, q_raw = E.magnitude, q.magnitude
+
+    report("DCS.__call__ (Quantity)",
+           timeit(lambda: dcs(E, q), number=repeat) / repeat, n_points)
+    report("DCS.evaluate (Quantity)",
+           timeit(lambda: dcs.evaluate(E, q), number=repeat) / repeat,
+           n_points)
+    report("DCS.evaluate (ndarray)",
+           timeit(lambda: dcs.evaluate(E_raw, q_raw), number=repeat)
+           / repeat, n_points)
+
+
+def bench_interpolator(dcs, n_points=10**7, repeat=3):
+    E = np.random.uniform(1, 1e4, n_points)
+    q = np.random.uniform(0, 10, n_points)
+    log_E = np.log(E)
+
+    report("RegularGridInterpolator",
+           timeit(lambda: dcs.interpolate_fn((log_E, q)), number=repeat)
+           / repeat, n_points)
+    report("DCS.evaluate (uniform axes)",
+           timeit(lambda: dcs.evaluate(E, q), number=repeat) / repeat,
+           n_points)
+
+    irregular = DCS(dcs.energy, dcs.q * (1 + 1e-5 * np.random.random(
+        dcs.q.size)), dcs.cs)
+    report("DCS.evaluate (irregular axes)",
+           timeit(lambda: irregular.evaluate(E, q), number=repeat) / repeat,
+           n_points)
+
+
+def bench_chunked(dcs, n_points=10**7):
+    E = np.random.uniform(1, 1e4, n_points) * units.eV
+    q = np.random.uniform(0, 10, n_points) * units('1/nm')
+    out = np.empty(n_points)
+
+    for name, f in [
+            ("DCS.evaluate", lambda: dcs.evaluate(E, q)),
+            ("DCS.evaluate (out=...)", lambda: dcs.evaluate(E, q, out=out))]:
+        tracemalloc.start()
+        seconds = timeit(f, number=1)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print("{:<40} {:10.3f} ms {:10.1f} MB peak".format(
+            name, seconds * 1e3, peak / 2**20))
+
+
+def bench_grid(dcs, n=1000, m=1000, repeat=5):
+    E = np.logspace(0, 4, n)
+    q = np.linspace(0, 10, m)
+    E_pts = np.repeat(E, m) * units.eV
+    q_pts = np.tile(q, n) * units('1/nm')
+
+    report("DCS.__call__ (point list)",
+           timeit(lambda: dcs(E_pts, q_pts), number=repeat) / repeat, n*m)
+    report("DCS.evaluate (grid=True)",
+           timeit(lambda: dcs.evaluate(E, q, grid=True), number=repeat)
+           / repeat, n*m)
+
+
+def bench_icdf(n=5000, m=1000, n_p=1024):
+    dcs = make_dcs(n, m)
+    seconds = timeit(lambda: dcs.to_icdf(n_p), number=1)
+    print("{:<40} {:10.3f} s  ({} energies)".format(
+        "DCS.to_icdf", seconds, n))
+
+
+if __name__ == '__main__':
+    dcs = make_dcs()
+    bench_call(dcs)
+    bench_interpolator(dcs)
+    bench_chunked(dcs)
+    bench_grid(dcs)
+    bench_icdf()
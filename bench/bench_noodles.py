@@ -0,0 +1,119 @@
+"""Benchmarks for :py:mod:`cslib.noodles`.
+
+Run as a script, with CSLib installed: ``python bench/bench_noodles.py``."""
+
+from timeit import default_timer
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+from noodles.serial import (Serialiser, Registry, base)
+from noodles.serial.numpy import arrays_to_hdf5
+
+from cslib import (units, DCS, Settings)
+from cslib.noodles import (
+    registry, quantity_hook, SerStandardObject, SerUnit, ResultCache)
+
+
+class SerQuantityTuple(Serialiser):
+    """The Quantity serialiser before magnitudes were stored out-of-band,
+    for comparison."""
+    def encode(self, obj, make_rec):
+        return make_rec(obj.to_tuple())
+
+    def decode(self, cls, data):
+        return units.Quantity.from_tuple(data)
+
+
+def hdf5_registry(filename):
+    """The registry before arrays were stored out-of-band as .npy files,
+    for comparison."""
+    return Registry(
+        parent=base() + arrays_to_hdf5(filename),
+        types={DCS: SerStandardObject(DCS, ['energy', 'q', 'cs'])},
+        hooks={'<quantity>': SerQuantityTuple('<quantity>'),
+               '<unit>': SerUnit('<unit>')},
+        hook_fn=quantity_hook)
+
+
+def round_trip(reg, obj):
+    start = default_timer()
+    text = reg.to_json(obj)
+    middle = default_timer()
+    reg.from_json(text, deref=True)
+    return middle - start, default_timer() - middle, len(text)
+
+
+def bench(directory, sizes=(1000, 4000)):
+    for n in sizes:
+        energy = np.logspace(1, 4, n) * units.eV
+        q = np.linspace(0, 10, n) * units('1/nm')
+        dcs = DCS(energy, q, np.random.rand(n, n) * units('nm^3'))
+        mb = dcs.cs.magnitude.nbytes / 2**20
+
+        print('DCS of {0}x{0} ({1:.0f} MB)'.format(n, mb))
+        for label, reg in [
+                ('HDF5 + to_tuple', hdf5_registry(
+                    os.path.join(directory, 'cache{}.hdf5'.format(n)))),
+                ('out-of-band .npy', registry(directory))]:
+            encode, decode, length = round_trip(reg, dcs)
+            print('  {:18s} encode {:7.1f} ms, decode {:7.1f} ms, '
+                  '{:6.0f} MB/s, {:7d} bytes of JSON'.format(
+                      label, encode * 1e3, decode * 1e3,
+                      mb / (encode + decode), length))
+
+
+def bench_decode(directory, sizes=(100, 4000), number=20):
+    constructor = registry(directory) + Registry(
+        types={DCS: SerStandardObject(DCS, ['energy', 'q', 'cs'])})
+    for n in sizes:
+        energy = np.logspace(1, 4, n) * units.eV
+        q = np.linspace(0, 10, n) * units('1/nm')
+        dcs = DCS(energy, q, np.random.rand(n, n) * units('nm^3'))
+
+        print('Decoding a DCS of {0}x{0}'.format(n))
+        for label, reg in [('constructor', constructor),
+                           ('restored', registry(directory))]:
+            rec = json.loads(reg.to_json(dcs))
+            start = default_timer()
+            for i in range(number):
+                reg.deep_decode(rec)
+            print('  {:12s} {:8.2f} ms'.format(
+                label, (default_timer() - start) / number * 1e3))
+
+
+def rescale(settings, dcs):
+    return settings.factor * dcs
+
+
+def bench_cache(directory, n=4000):
+    energy = np.logspace(1, 4, n) * units.eV
+    q = np.linspace(0, 10, n) * units('1/nm')
+    dcs = DCS(energy, q, np.random.rand(n, n) * units('nm^3'))
+    settings = Settings(factor=2.0)
+    cached = ResultCache(rescale, os.path.join(directory, 'results'))
+
+    print('ResultCache, DCS of {0}x{0}'.format(n))
+    start = default_timer()
+    cached.key(settings, dcs)
+    print('  key from array bytes   {:7.1f} ms'.format(
+        (default_timer() - start) * 1e3))
+    start = default_timer()
+    hashlib.sha256(registry().to_json(
+        [settings, dcs]).encode()).hexdigest()
+    print('  key from inline JSON   {:7.1f} ms'.format(
+        (default_timer() - start) * 1e3))
+    for label in ['miss', 'hit']:
+        start = default_timer()
+        cached(settings, dcs)
+        print('  {:22s} {:7.1f} ms'.format(
+            label, (default_timer() - start) * 1e3))
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as directory:
+        bench(directory)
+        bench_decode(directory)
+        bench_cache(directory)
@@ -0,0 +1,109 @@
+"""Benchmarks for :py:mod:`cslib.numeric`.
+
+Run as a script, with CSLib installed: ``python bench/bench_numeric.py``."""
+
+from timeit import timeit
+
+import numpy as np
+from scipy.interpolate import interp1d
+
+from cslib import units
+from cslib.numeric import (
+    loglog_interpolate, log_interpolate_f, compose, ArrayCache)
+
+
+def interp1d_loglog(x, y):
+    """The implementation of `loglog_interpolate` before it became a
+    class, for comparison."""
+    interp_function = interp1d(np.log(x.magnitude), np.log(y.magnitude),
+                               fill_value='extrapolate')
+
+    def g(x_points):
+        return np.exp(interp_function(
+            np.log(x_points.to(x.units).magnitude))) * y.units
+
+    return g
+
+
+def where_log_interpolate_f(f1, f2, h, a, b):
+    """The implementation of `log_interpolate_f` before it evaluated each
+    branch only where needed, for comparison."""
+    def g(x):
+        y1 = f1(x)
+        y2 = f2(x)
+        units = y1.units
+        y2 = y2.to(units).magnitude
+        y1 = y1.magnitude
+        u = np.clip(np.log(x / a) / np.log(b / a), 0.0, 1.0)
+        w = h(u)
+        ym = (1 - w) * y1 + w * y2
+        return np.where(x < a, y1, np.where(x > b, y2, ym)) * units
+    return g
+
+
+def report(name, seconds, n_points):
+    print("{:<40} {:10.3f} ms {:10.1f} Mpts/s".format(
+        name, seconds * 1e3, n_points / seconds / 1e6))
+
+
+def bench_loglog(n_data=500, repeat=5):
+    x = np.logspace(0, 4, n_data) * units.eV
+    y = np.random.uniform(1, 2, n_data) * units('nm^2')
+    old = interp1d_loglog(x, y)
+    new = loglog_interpolate(x, y)
+
+    for n_points in [10, 10**6]:
+        points = np.random.uniform(1, 1e4, n_points) * units.eV
+        raw = points.magnitude
+        number = repeat * max(1, 10**5 // n_points)
+        for name, f in [("interp1d closure", lambda: old(points)),
+                        ("LogLogInterpolator", lambda: new(points)),
+                        ("LogLogInterpolator.evaluate",
+                         lambda: new.evaluate(raw))]:
+            report("{} ({} pts)".format(name, n_points),
+                   timeit(f, number=number) / number, n_points)
+
+
+def bench_blend(n_points=10**6, repeat=3):
+    x = np.logspace(0, 4, 200) * units.eV
+    low = loglog_interpolate(x, x.magnitude**-1 * units('nm^2'))
+    high = loglog_interpolate(x, x.magnitude**-2 * units('nm^2'))
+    points = np.logspace(0, 4, n_points) * units.eV
+    a, b = 90 * units.eV, 110 * units.eV
+
+    def h(u):
+        return u
+
+    for name, blend in [("np.where blend", where_log_interpolate_f),
+                        ("log_interpolate_f", log_interpolate_f)]:
+        f = blend(low, high, h, a, b)
+        nested = blend(f, compose(f, identity_energy), h, 1 * units.keV,
+                       2 * units.keV)
+        report(name, timeit(lambda: f(points), number=repeat) / repeat,
+               n_points)
+        report(name + " (nested)",
+               timeit(lambda: nested(points), number=repeat) / repeat,
+               n_points)
+
+
+def identity_energy(E):
+    return E
+
+
+def bench_cache(n_points=10**6, repeat=5):
+    x = np.logspace(0, 4, 200) * units.eV
+    f = loglog_interpolate(x, x.magnitude**-1 * units('nm^2'))
+    cached = ArrayCache(f)
+    points = np.logspace(0, 4, n_points) * units.eV
+
+    report("LogLogInterpolator", timeit(lambda: f(points), number=repeat)
+           / repeat, n_points)
+    report("ArrayCache hit", timeit(lambda: cached(points), number=repeat)
+           / repeat, n_points)
+    print(cached.cache_info())
+
+
+if __name__ == '__main__':
+    bench_loglog()
+    bench_blend()
+    bench_cache()
@@ -0,0 +1,38 @@
+"""Benchmark of :py:mod:`cslib.parallel` against serial tabulation.
+
+Run as a script, with CSLib installed: ``python bench/bench_parallel.py``."""
+
+from timeit import timeit
+import os
+
+import numpy as np
+
+from cslib import units
+from cslib.parallel import (tabulate_dcs)
+
+
+def model(E, q):
+    """A deliberately expensive, picklable stand-in for a physics model."""
+    E, q = E.magnitude, q.magnitude
+    cs = np.zeros(np.broadcast(E, q).shape)
+    for n in range(1, 20):
+        cs += np.exp(-n * q / np.sqrt(E)) / (n * q**2 + 1)**2
+    return cs * units('nm^3')
+
+
+def bench(n=2000, m=1000):
+    energy = np.logspace(0, 4, n) * units.eV
+    q = np.linspace(0, 10, m) * units('1/nm')
+    workers = os.cpu_count()
+
+    for name, kwargs in [
+            ("serial", {'max_workers': 1}),
+            ("threads x {}".format(workers), {'use_threads': True}),
+            ("processes x {}".format(workers), {})]:
+        seconds = timeit(lambda: tabulate_dcs(model, energy, q, **kwargs),
+                         number=1)
+        print("{:<40} {:10.3f} s".format(name, seconds))
+
+
+if __name__ == '__main__':
+    bench()
@@ -0,0 +1,37 @@
+"""Benchmarks for :py:mod:`cslib.settings`.
+
+Run as a script, with CSLib installed: ``python bench/bench_settings.py``."""
+
+from timeit import timeit
+
+from cslib import (Settings, Model, Type, units)
+
+
+def bench(number=10**6):
+    model = Model(seed=Type('Random seed.', default=42))
+    settings = Settings(_model=model)
+    settings.beam.energy = 10 * units.keV
+    settings.sample.layer.thickness = 20 * units.nm
+    frozen = settings.freeze()
+
+    print('{} lookups, in ns per lookup'.format(number))
+    for label, stmt in [
+            ("settings.beam.energy", lambda: settings.beam.energy),
+            ("settings['beam.energy']", lambda: settings['beam.energy']),
+            ("settings.sample.layer.thickness",
+             lambda: settings.sample.layer.thickness),
+            ("settings.seed (default)", lambda: settings.seed),
+            ("frozen.beam.energy", lambda: frozen.beam.energy),
+            ("frozen['beam.energy']", lambda: frozen['beam.energy']),
+            ("frozen.sample.layer.thickness",
+             lambda: frozen.sample.layer.thickness),
+            ("frozen.seed (default)", lambda: frozen.seed)]:
+        t = timeit(stmt, number=number) / number
+        print('  {:32s} {:8.1f}'.format(label, t * 1e9))
+
+    t = timeit(settings.freeze, number=1000) / 1000
+    print('freeze: {:.1f} us'.format(t * 1e6))
+
+
+if __name__ == '__main__':
+    bench()
@@ -2,6 +2,12 @@ from functools import reduce
 import numpy as np
 from scipy.interpolate import RegularGridInterpolator
 from . import units as ur
+from .numeric import inverse_cdf
+
+
+DEFAULT_CHUNK_SIZE = 2**20
+"""Number of query points per chunk in :py:meth:`DCS.evaluate`, when an
+output buffer is given without a chunk size."""
 
 
 class DCS(object):
@@ -18,10 +24,6 @@ class DCS(object):
         if len(energy.shape) == 1:
             energy = energy.reshape([energy.size, 1])
 
-        self.energy = energy
-        self.q = q
-        self.cs = cs
-
         assert energy.shape == (energy.size, 1), \
             "Energy should be column vector."
         assert q.shape == (q.size,), \
@@ -29,31 +31,362 @@ class DCS(object):
 
         assert energy.dimensionality == ur.J.dimensionality, \
             "Energy units check."
-        assert cs.dimensionality in (             \
-            (ur.m**2 / q.units).dimensionality,   \
-            (ur.m**-1 / q.units).dimensionality), \
+
+        self.energy = _read_only(energy)
+        self.q = _read_only(q)
+        self._log_energy = np.log(self.energy.magnitude.flat)
+        self._log_energy.flags.writeable = False
+        self._log_energy_step = _uniform_step(self._log_energy)
+        self._q_step = _uniform_step(self.q.magnitude)
+        self._set_cs(cs)
+
+    def _set_cs(self, cs, owned=False):
+        """Set the cross-section table. This is either a Quantity, or a
+        lazy dataset handle (see :py:meth:`load`) that is read when needed.
+        Unless `owned` is True, the table may be shared with the caller, and
+        is copied before it is changed in place."""
+        assert ur.Quantity(1, cs.units).dimensionality in ( \
+            (ur.m**2 / self.q.units).dimensionality,        \
+            (ur.m**-1 / self.q.units).dimensionality),      \
             "Cross-section units check."
-        assert cs.shape == (energy.size, q.size), \
+        assert cs.shape == (self.energy.size, self.q.size), \
             "Array dimensions do not match."
 
-        self.interpolate_fn = RegularGridInterpolator((
-            np.log(self.energy.magnitude.flat),
-            self.q.magnitude.flat),
-            self.cs.magnitude,
-            bounds_error = False, fill_value = 0)
+        if isinstance(cs, ur.Quantity):
+            self._cs, self._cs_source = cs, None
+        else:
+            self._cs, self._cs_source = None, cs
+        self._cs_units = cs.units
+        self._owns_cs = owned
+        self._interpolate_fn = None
+
+    @property
+    def cs(self):
+        """The cross-section table. For a table that was loaded lazily,
+        this reads the whole table from file."""
+        if self._cs is None:
+            self._cs = self._cs_source.read()
+            self._owns_cs = True
+        return self._cs
+
+    def _derive(self, cs, owned=True):
+        """Create a new DCS on the same axes as this one, sharing the
+        axis arrays instead of checking and copying them again. By default
+        the new table owns `cs`, which should be a new array."""
+        obj = DCS.__new__(DCS)
+        obj.energy = self.energy
+        obj.q = self.q
+        obj._log_energy = self._log_energy
+        obj._log_energy_step = self._log_energy_step
+        obj._q_step = self._q_step
+        obj._set_cs(cs, owned)
+        return obj
+
+    @staticmethod
+    def _restore(energy, q, cs, log_energy, log_energy_step, q_step):
+        """Rebuild a DCS from the state of one that passed the checks of
+        the constructor before, as stored by the Noodles serialiser,
+        without checking or computing it again."""
+        obj = DCS.__new__(DCS)
+        obj.energy = _read_only(energy)
+        obj.q = _read_only(q)
+        obj._log_energy = np.asarray(log_energy).view()
+        obj._log_energy.flags.writeable = False
+        obj._log_energy_step = log_energy_step
+        obj._q_step = q_step
+        obj._cs, obj._cs_source = cs, None
+        obj._cs_units = cs.units
+        obj._owns_cs = False
+        obj._interpolate_fn = None
+        return obj
+
+    def _check_axes(self, other):
+        assert isinstance(other, DCS)
+        if other.energy is not self.energy:
+            assert _quantity_equal(self.energy, other.energy), \
+                "to add DCS, axes should match"
+        if other.q is not self.q:
+            assert _quantity_equal(self.q, other.q), \
+                "to add DCS, axes should match"
+
+    @property
+    def interpolate_fn(self):
+        """Interpolator over log-energy and q; built on first use.
+        :py:meth:`evaluate` does not use it, but gives the same results."""
+        if self._interpolate_fn is None:
+            self._interpolate_fn = RegularGridInterpolator((
+                self._log_energy,
+                self.q.magnitude),
+                self.cs.magnitude,
+                bounds_error = False, fill_value = 0)
+        return self._interpolate_fn
 
     def __rmul__(self, other):
-        return DCS(self.energy, self.q, self.cs * other)
+        return self._derive(self.cs * other)
 
     def __add__(self, other):
-        assert isinstance(other, DCS)
-        assert np.array_equal(self.energy, other.energy), \
-            "to add DCS, axes should match"
-        assert np.array_equal(self.q, other.q), \
-            "to add DCS, axes should match"
-        return DCS(self.energy, self.q, self.cs + other.cs)
+        self._check_axes(other)
+        return self._derive(self.cs + other.cs)
+
+    def __imul__(self, other):
+        cs = self._own_cs()
+        cs *= other
+        self._set_cs(cs, owned=True)
+        return self
+
+    def __iadd__(self, other):
+        self._check_axes(other)
+        cs = self._own_cs()
+        cs += other.cs
+        self._set_cs(cs, owned=True)
+        return self
+
+    def _own_cs(self):
+        """The table, copied first if it may be shared with others."""
+        if not self._owns_cs:
+            self._cs = self.cs.copy()
+            self._owns_cs = True
+        return self.cs
+
+    @staticmethod
+    def linear_combination(weights, tables):
+        """Compute `sum(w * t for w, t in zip(weights, tables))` in a
+        single output buffer, without creating the intermediate tables.
+
+        The weights may be numbers, Quantities, or arrays that broadcast
+        against the cross-section. All tables must share the same axes.
+        The result has the units of `weights[0] * tables[0].cs`."""
+        weights = list(weights)
+        tables = list(tables)
+        assert len(weights) == len(tables) and tables, \
+            "need one weight for every table"
+
+        first = tables[0]
+        for t in tables[1:]:
+            first._check_axes(t)
+
+        unit = _units(weights[0]) * first.cs.units
+        result = np.zeros(first.cs.shape)
+        term = np.empty(first.cs.shape)
+        for w, t in zip(weights, tables):
+            factor = (1 * _units(w) * t.cs.units).to(unit).magnitude
+            w = w.magnitude if hasattr(w, 'units') else w
+            np.multiply(t.cs.magnitude, np.multiply(w, factor), out=term)
+            result += term
+
+        return first._derive(ur.Quantity(result, unit))
 
     def __call__(self, E, q):
-        return self.interpolate_fn((
-            np.log(E.to(self.energy.units).magnitude), \
-            q.to(self.q.units).magnitude)) * self.cs.units
+        return ur.Quantity(self.evaluate(E, q), self._cs_units)
+
+    def evaluate(self, E, q, grid=False, out=None, chunk_size=None):
+        """Evaluate the cross-section without wrapping the result in a
+        Quantity.
+
+        `E` and `q` may be Quantities, in which case they are converted
+        to the units of the table once for the whole batch, or plain arrays
+        that are taken to be in the units of `self.energy` and `self.q`.
+        The result is a plain array in units of `self.cs.units`.
+
+        If `grid` is True, `E` and `q` are the axes of a grid, and the
+        result has shape `E.shape + q.shape`. Otherwise `E` and `q` are
+        broadcast against each other.
+
+        Interpolation is bilinear in log-energy and q, and points outside
+        the table evaluate to zero. On uniform axes (log-uniform for the
+        energy) the interval is computed directly, instead of searched
+        for.
+
+        If `out` or `chunk_size` is given, the queries are processed in
+        chunks of about `chunk_size` points along the first axis of the
+        result, and written into `out`. Unit conversion is then done per
+        chunk as well, so the memory needed on top of `out` does not grow
+        with the number of queries. `out` may be any writable array of the
+        right shape, such as a :py:class:`numpy.memmap`; if it is not
+        given, a new array is allocated."""
+        E, q = _as_array(E), _as_array(q)
+        if grid:
+            E = E.reshape(E.shape + (1,) * len(q.shape))
+
+        if out is None and chunk_size is None:
+            return self._interpolate(
+                np.log(_magnitude(E, self.energy.units)),
+                _magnitude(q, self.q.units))
+
+        shape = np.broadcast(np.broadcast_to(False, E.shape),
+                             np.broadcast_to(False, q.shape)).shape
+        if out is None:
+            out = np.empty(shape)
+        elif out.shape != shape:
+            raise ValueError('Output buffer has shape {}, expected {}.'
+                             .format(out.shape, shape))
+
+        if not shape:
+            out[...] = self.evaluate(E, q)
+            return out
+
+        E = E.reshape((1,) * (len(shape) - len(E.shape)) + E.shape)
+        q = q.reshape((1,) * (len(shape) - len(q.shape)) + q.shape)
+        row_size = max(int(np.prod(shape[1:])), 1)
+        step = max(1, (chunk_size or DEFAULT_CHUNK_SIZE) // row_size)
+
+        for start in range(0, shape[0], step):
+            rows = slice(start, start + step)
+            E_chunk = E if E.shape[0] == 1 else E[rows]
+            q_chunk = q if q.shape[0] == 1 else q[rows]
+            out[rows] = self.evaluate(E_chunk, q_chunk)
+
+        return out
+
+    def _interpolate(self, log_E, q):
+        """Bilinear interpolation on plain arrays of log-energy and q, in
+        the units of the table."""
+        if log_E.ndim == 0 and q.ndim == 0:
+            return self._interpolate(log_E.reshape(1), q.reshape(1))[0]
+
+        i, u, E_outside = _locate(log_E, self._log_energy,
+                                  self._log_energy_step)
+        j, v, q_outside = _locate(q, self.q.magnitude, self._q_step)
+
+        if self._cs is None:
+            # Read only the rows that are needed, and renumber them.
+            rows = np.unique(np.concatenate([i.ravel(), i.ravel() + 1]))
+            cs = self._cs_source[rows].to(self._cs_units).magnitude
+            i = np.searchsorted(rows, i)
+        else:
+            cs = self.cs.magnitude
+        if not cs.flags.c_contiguous:
+            cs = np.ascontiguousarray(cs)
+        cs = cs.ravel()
+        M = self.q.size
+        k = i * M + j
+
+        result = cs.take(k)
+        result *= 1 - v
+        result += cs.take(k + 1) * v
+        result *= 1 - u
+        k += M
+        result += (cs.take(k) * (1 - v) + cs.take(k + 1) * v) * u
+        np.copyto(result, 0.0, where=E_outside | q_outside)
+        return result
+
+    def to_icdf(self, n):
+        """Compute the inverse cumulative distribution over `q` for every
+        energy in the table, at `n` equally spaced probabilities from 0
+        to 1, as used for Monte Carlo sampling.
+
+        Returns a tuple `(icdf, total)`: `icdf` has shape [N, n] and the
+        units of `q`; `total` is the cross-section integrated over `q`,
+        with shape [N]. Energies with a zero total cross-section give
+        NaN in `icdf`."""
+        p = np.linspace(0.0, 1.0, n)
+        icdf, total = inverse_cdf(
+            self.q.magnitude, self.cs.magnitude, p)
+        return ur.Quantity(icdf, self.q.units), \
+            ur.Quantity(total, self.cs.units * self.q.units)
+
+    def save(self, group, name='cs', **storage):
+        """Save the table to a :py:class:`cslib.datafile` group, as dataset
+        `name` with dimension scales 'energy' and 'q'. If the group already
+        has these scales, they are reused, provided they are equal to the
+        axes of this table; this way several tables on the same axes can
+        share a group. Further keyword arguments are passed on to
+        `add_dataset` and set the storage layout; by default the table is
+        chunked by energy (`chunks='rows'`), which suits lazy loading."""
+        for scale, value in [('energy', self.energy.reshape(-1)),
+                             ('q', self.q)]:
+            if scale not in group.scales:
+                group.add_scale(scale, value)
+            elif not _quantity_equal(value, group.get_dataset(scale)):
+                raise ValueError(
+                    'Scale {} already exists with different values.'
+                    .format(scale))
+
+        storage.setdefault('chunks', 'rows')
+        group.add_dataset(name, self.cs, ('energy', 'q'), **storage)
+
+    @staticmethod
+    def load(group, name='cs', lazy=False):
+        """Load a table saved with :py:meth:`save` from a
+        :py:class:`cslib.datafile` group.
+
+        If `lazy` is True, only the axes are read. Evaluating the table then
+        reads just the energy rows that the queries fall between, so the
+        file must stay open while the table is in use. Accessing `cs`, or
+        combining the table with others, reads the whole table."""
+        dataset = group.get_lazy_dataset(name)
+        # The scales are looked up by their absolute path in the file
+        energy, q = (group.get_dataset(dim[0].name)
+                     for dim in dataset.dataset.dims)
+        return DCS(energy, q, dataset if lazy else dataset.read())
+
+
+def _read_only(x):
+    """Return a read-only view of the Quantity `x`, so that axes can be
+    shared safely between tables."""
+    magnitude = np.asarray(x.magnitude).view()
+    magnitude.flags.writeable = False
+    return ur.Quantity(magnitude, x.units)
+
+
+def _uniform_step(x, rtol=1e-9):
+    """Return the step of the grid `x` if it is uniform to within `rtol`
+    of the step size, None otherwise."""
+    if x.size < 2:
+        return None
+    step = (x[-1] - x[0]) / (x.size - 1)
+    nodes = x[0] + step * np.arange(x.size)
+    if np.all(np.abs(x - nodes) <= rtol * abs(step)):
+        return step
+    return None
+
+
+def _locate(x, grid, step):
+    """Find the interval of `grid` that contains each point in `x`.
+
+    Returns the index of the interval, the relative position within it,
+    and a mask that is True for points outside the grid (NaN is not
+    outside, so that it propagates to the result). If `step` is given, the
+    grid is uniform and the index is computed directly."""
+    n = grid.size
+    if step is not None:
+        with np.errstate(invalid='ignore'):
+            i = np.floor((x - grid[0]) / step).astype(np.intp)
+    else:
+        i = np.searchsorted(grid, x) - 1
+    # A scalar `x` gives a NumPy scalar, which cannot be clipped in place
+    i = np.asarray(i)
+    np.clip(i, 0, n - 2, out=i)
+
+    lower = grid[i]
+    u = (x - lower) / (grid[i+1] - lower)
+    outside = (x < grid[0]) | (x > grid[-1])
+    return i, u, outside
+
+
+def _quantity_equal(a, b):
+    return a.dimensionality == b.dimensionality and \
+        np.array_equal(a.magnitude, b.to(a.units).magnitude)
+
+
+def _units(x):
+    if hasattr(x, 'units'):
+        return x.units
+    return ur.dimensionless
+
+
+def _as_array(x):
+    """Make sure `x` (a Quantity or not) wraps an ndarray."""
+    if hasattr(x, 'units'):
+        if isinstance(x.magnitude, np.ndarray):
+            return x
+        return ur.Quantity(np.asarray(x.magnitude), x.units)
+    return np.asarray(x)
+
+
+def _magnitude(x, unit):
+    """Return `x` as a plain array in `unit`. Arrays without units are
+    assumed to be given in `unit` already."""
+    if hasattr(x, 'units'):
+        return np.asarray(x.to(unit).magnitude)
+    return np.asarray(x)
@@ -1,7 +1,16 @@
+import numbers
 import numpy as np
 from .units import units
 import h5py
 
+CHUNK_BYTES = 2**18
+"""Target size of the chunks of datasets stored with `chunks='rows'`."""
+
+MEMMAP_READ_BYTES = 2**23
+"""Contiguous datasets of at least this size are read through a memory map
+rather than HDF5. Below it, setting up the map costs more than it saves."""
+
+
 class datafile:
     """Class to store datasets, including units. It is a thin wrapper around
     h5py to store HDF5 files.
@@ -14,6 +23,9 @@ class datafile:
     or float values. Internally, if the value is a string, it uses the HDF5
     attribute system, while if the value is a number, we use a special
     "properties" dataset, containing data in the form key - value - unit.
+
+    All properties are read and decoded in one go on first access, and
+    kept in a cache that is updated when properties are set.
     """
 
     def __init__(self, filename, mode):
@@ -25,6 +37,7 @@ class datafile:
             a  Read-write if exists, create otherwise
         """
         self.file = h5py.File(filename, mode)
+        self._properties = None
     def close(self):
         self.file.close()
 
@@ -52,17 +65,22 @@ class datafile:
                 dtype=np.dtype([('value', float),
                                 ('unit', h5py.special_dtype(vlen=bytes))]))
 
+        if self._properties is not None:
+            self._properties[key] = _property_value(self.file.attrs[key])
+
     def list_properties(self):
         return self.file.attrs.keys()
 
     def get_property(self, key):
-        value = self.file.attrs[key]
-        if isinstance(value, (float, int)):
-            return value
-        elif isinstance(value, bytes):
-            return value.decode('ascii')
-        else:
-            return value[0] * units(value[1].decode('ascii'))
+        return self.get_properties()[key]
+
+    def get_properties(self):
+        """Return a dictionary of all properties. Treat it as read-only;
+        use set_property to change properties."""
+        if self._properties is None:
+            self._properties = {key: _property_value(value)
+                                for key, value in self.file.attrs.items()}
+        return self._properties
 
 
     # Utility functions for use in a with: statement
@@ -79,27 +97,47 @@ class datafile_group:
     and associated dimension scales"""
     def __init__(self, h5_group):
         self.group = h5_group
-        self.scales = {}
+        self.scales = {name: dset for name, dset in h5_group.items()
+                       if isinstance(dset, h5py.Dataset)
+                       and h5py.h5ds.is_scale(dset.id)}
 
 
-    def add_scale(self, name, data, unit=None):
+    def add_scale(self, name, data, unit=None, chunks=None,
+                  compression=None, compression_opts=None, shuffle=False):
+        """Add dimension scale, with name and data. The storage options
+        are those of add_dataset, except that scales are stored
+        contiguously by default."""
         if name in self.scales:
             raise ValueError('Scale already exists.')
 
         data, unit = _strip_unit(data, unit)
 
-        h5_dset = self.group.create_dataset(name, data = data)
+        h5_dset = _create_dataset(self.group, name, data, chunks,
+                                  compression, compression_opts, shuffle)
         h5_dset.attrs['units'] = unit.encode('ascii')
         h5py.h5ds.set_scale(h5_dset.id, name.encode('ascii'))
         self.scales[name] = h5_dset
 
 
-    def add_dataset(self, name, data, scales, unit=None):
+    def add_dataset(self, name, data, scales, unit=None, chunks=None,
+                    compression=None, compression_opts=None, shuffle=False):
         """Add dataset, with name and data.
 
         The scales parameter is a tuple of names, each belonging to the
         dimension scale attached to the corresponding dimension of 'data'. May
         be None.
+
+        The remaining parameters control how the data is stored:
+            chunks       None (default) stores the data contiguously, which
+                         allows memory mapping. 'rows' groups whole indices
+                         along the first axis, e.g. energies of a DCS table,
+                         in chunks of about CHUNK_BYTES, so that reading a
+                         few rows reads little else. True lets h5py choose,
+                         or give a chunk shape.
+            compression  None, 'gzip' or 'lzf'.
+            compression_opts  Compression level for gzip (0-9).
+            shuffle      Apply the byte shuffle filter, which often helps
+                         compression of floating point data.
         """
         if scales is None:
             scales = (None,) * len(data.shape)
@@ -110,22 +148,69 @@ class datafile_group:
             raise ValueError('Wrong number of dimension scales provided'
                              'when creating dataset.')
 
-        # Check that all scales are correct
-        for dim_id, scale_name in enumerate(scales):
-            if scale_name is None:
-                continue
-            if scale_name not in self.scales:
-                raise ValueError('Using unknown dimension scale.')
-            if len(self.scales[scale_name]) != data.shape[dim_id]:
-                raise ValueError('Dimension has different size than its scale.')
+        self._check_scales(scales, data.shape)
 
         data, unit = _strip_unit(data, unit)
 
         # Create the dataset
-        h5_dset = self.group.create_dataset(name, data = data)
+        h5_dset = _create_dataset(self.group, name, data, chunks,
+                                  compression, compression_opts, shuffle)
+        h5_dset.attrs['units'] = unit.encode('ascii')
+
+        self._attach_scales(h5_dset, scales)
+
+    def create_dataset_writer(self, name, row_shape, scales, unit,
+                              dtype=float, chunks='rows', compression=None,
+                              compression_opts=None, shuffle=False,
+                              flush_bytes=2**26):
+        """Create an empty dataset that grows along its first axis, and
+        return a datafile_writer that appends blocks of rows to it.
+
+        row_shape is the shape of a single row; scales are as in
+        add_dataset, except that the scale of the first axis is not
+        checked against the (still growing) length of the data. The unit
+        is stored once; rows are converted to it when appended. The file
+        is flushed every time flush_bytes have been written. The storage
+        options are those of add_dataset.
+        """
+        row_shape = tuple(row_shape)
+        if scales is None:
+            scales = (None,) * (len(row_shape) + 1)
+        else:
+            scales = tuple(scales)
+
+        if len(scales) != len(row_shape) + 1:
+            raise ValueError('Wrong number of dimension scales provided'
+                             'when creating dataset.')
+        self._check_scales(scales[1:], row_shape, first_dim=1)
+
+        unit = str(units.parse_units(unit) if isinstance(unit, str)
+                   else unit)
+        if isinstance(chunks, str) and chunks == 'rows':
+            chunks = _row_chunks((None,) + row_shape, np.dtype(dtype)) \
+                or True
+
+        h5_dset = _create_dataset(
+            self.group, name, None, chunks, compression, compression_opts,
+            shuffle, shape=(0,) + row_shape, maxshape=(None,) + row_shape,
+            dtype=dtype)
         h5_dset.attrs['units'] = unit.encode('ascii')
+        self._attach_scales(h5_dset, scales)
+
+        return datafile_writer(h5_dset, unit, flush_bytes)
+
+    def _check_scales(self, scales, shape, first_dim=0):
+        """Check that all scales exist and match the data in size."""
+        for dim_id, scale_name in enumerate(scales):
+            if scale_name is None:
+                continue
+            if scale_name not in self.scales:
+                raise ValueError('Using unknown dimension scale.')
+            if len(self.scales[scale_name]) != shape[dim_id]:
+                raise ValueError('Dimension {} has different size than its '
+                                 'scale.'.format(dim_id + first_dim))
 
-        # Attach the dimension scales
+    def _attach_scales(self, h5_dset, scales):
         for dim_id, scale_name in enumerate(scales):
             if scale_name is None:
                 continue
@@ -133,11 +218,176 @@ class datafile_group:
             h5_dset.dims[dim_id].attach_scale(h5_scale)
 
     def get_dataset(self, name):
-        h5_dset = self.group[name]
-        data = np.copy(h5_dset[()]) * units(h5_dset.attrs['units'].decode('ascii'))
-        return data
+        return self.get_lazy_dataset(name).read()
+
+    def get_lazy_dataset(self, name):
+        """Get a handle to a dataset that reads data only when indexed."""
+        return datafile_dataset(self.group[name])
+
+
+
+
+class datafile_writer:
+    """Appends blocks of rows to a dataset created with
+    datafile_group.create_dataset_writer. Can be used in a with: statement,
+    which flushes the file at the end."""
+    def __init__(self, h5_dset, unit, flush_bytes):
+        self.dataset = h5_dset
+        self.unit = unit
+        self.flush_bytes = flush_bytes
+        self._unflushed = 0
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def append(self, rows):
+        """Append a block of rows, with shape (n,) + row_shape. Quantities
+        are converted to the unit of the dataset; plain arrays are assumed
+        to be in that unit already."""
+        if hasattr(rows, 'units'):
+            rows = rows.to(self.unit).magnitude
+        rows = np.asarray(rows)
+        if rows.shape[1:] != self.dataset.shape[1:]:
+            raise ValueError('Rows of shape {} do not fit dataset of shape '
+                             '{}.'.format(rows.shape, self.dataset.shape))
+
+        start = len(self.dataset)
+        self.dataset.resize(start + len(rows), axis=0)
+        self.dataset[start:] = rows
+
+        self._unflushed += rows.nbytes
+        if self._unflushed >= self.flush_bytes:
+            self.flush()
+
+    def flush(self):
+        self.dataset.file.flush()
+        self._unflushed = 0
+
+    # Utility functions for use in a with: statement
+    def __enter__(self):
+        return self
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+
+
+
+class datafile_dataset:
+    """Lazy handle to a dataset in a datafile. Indexing it, as in
+    `ds[100:200, :]`, reads only the requested part of the dataset and
+    returns it with units.
+
+    If the dataset is stored contiguously and without compression, it is
+    read through a read-only np.memmap of the file, so that indexing
+    returns views instead of copies."""
+    def __init__(self, h5_dset):
+        self.dataset = h5_dset
+        self.units = _parse_units(_decode(h5_dset.attrs['units']))
+        self._memmap = None
+
+    @property
+    def shape(self):
+        return self.dataset.shape
+
+    @property
+    def dtype(self):
+        return self.dataset.dtype
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def memmap(self):
+        """Return the dataset as a read-only np.memmap, or None if it is
+        chunked, compressed or not yet allocated in the file."""
+        if self._memmap is None:
+            dset = self.dataset
+            if dset.chunks is not None or dset.compression is not None:
+                return None
+            offset = dset.id.get_offset()
+            if offset is None or dset.size == 0:
+                return None
+            f = dset.file
+            f.flush()
+            self._memmap = np.memmap(f.filename, mode='r',
+                                     dtype=dset.dtype, shape=dset.shape,
+                                     offset=offset)
+        return self._memmap
+
+    def read(self):
+        """Read the whole dataset into a new, writable array. Large
+        contiguous datasets are copied from the memory map, outside HDF5;
+        see `MEMMAP_READ_BYTES`."""
+        data = None
+        if self.dataset.nbytes >= MEMMAP_READ_BYTES:
+            data = self.memmap()
+        if data is None:
+            data = self.dataset[()]
+        else:
+            data = np.array(data)
+        return units.Quantity(data, self.units)
+
+    def __getitem__(self, key):
+        data = self.memmap()
+        if data is None:
+            data = self.dataset[key]
+        else:
+            data = data[key]
+        return units.Quantity(data, self.units)
+
+
+
+
+def _create_dataset(h5_group, name, data, chunks, compression,
+                    compression_opts, shuffle, **kwargs):
+    if data is not None:
+        data = np.asarray(data)
+    if isinstance(chunks, str) and chunks == 'rows':
+        chunks = _row_chunks(data.shape, data.dtype)
+    if chunks is None and (compression is not None or shuffle):
+        chunks = True
+    return h5_group.create_dataset(
+        name, data = data, chunks = chunks, compression = compression,
+        compression_opts = compression_opts, shuffle = shuffle, **kwargs)
+
+
+def _row_chunks(shape, dtype):
+    """Chunk shape holding whole indices along the first axis, as many as
+    fit in CHUNK_BYTES (at least one), or None for empty data. A length of
+    None along the first axis means the dataset still has to grow."""
+    if 0 in shape:
+        return None
+    row_bytes = dtype.itemsize * int(np.prod(shape[1:]))
+    n = max(1, CHUNK_BYTES // row_bytes)
+    if shape[0] is not None:
+        n = min(n, shape[0])
+    return (n,) + tuple(shape[1:])
+
+
+_unit_cache = {}
+
+
+def _parse_units(unit):
+    """Parse a unit string, reusing the result for strings seen before."""
+    if unit not in _unit_cache:
+        _unit_cache[unit] = units.parse_units(unit)
+    return _unit_cache[unit]
+
+
+def _property_value(value):
+    """Decode a property as stored by datafile.set_property."""
+    if isinstance(value, (bytes, str)):
+        return _decode(value)
+    if isinstance(value, numbers.Number):
+        return value
+    return units.Quantity(value[0], _parse_units(_decode(value[1])))
 
 
+def _decode(value):
+    """Attributes written as bytes may be read back as str, depending on
+    the version of h5py."""
+    if isinstance(value, bytes):
+        return value.decode('ascii')
+    return value
 
 
 def _strip_unit(value, unit = None):
@@ -0,0 +1,252 @@
+"""Access to a database of many datafiles at once.
+
+A :py:class:`datafile_collection` opens a set of HDF5 files written with
+:py:mod:`cslib.datafile` using a thread pool, and builds a manifest of
+their properties, groups and datasets (shapes, units and dimension scales)
+from the file metadata only. Datasets are read on demand.
+
+Note that h5py serialises calls into the HDF5 library, so the threads
+mostly help to overlap file system latency when opening files. Reading
+many small datasets is no faster than a plain loop; only contiguous
+datasets of at least :py:data:`cslib.datafile.MEMMAP_READ_BYTES` are
+copied from a memory map, outside HDF5, and those copies can overlap.
+
+A :py:class:`datafile_index` keeps the manifests of a directory of
+datafiles, together with the range of every dimension scale, in a JSON
+sidecar file. It is updated incrementally, and answers questions like
+"which materials have an elastic DCS covering 1 eV to 10 keV" without
+opening any HDF5 file."""
+
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+
+import h5py
+
+from .datafile import (datafile, _decode, _parse_units)
+from .units import units
+
+
+def read_manifest(f):
+    """Describe the contents of an open :py:class:`datafile`, without
+    reading any data. Returns a dictionary with the properties of the file
+    and, for every dataset (keyed on its path 'group/name'), its shape,
+    dtype, units, the names of its dimension scales (None where no scale is
+    attached) and whether it is a dimension scale itself."""
+    datasets = {}
+
+    def visit(path, obj):
+        if not isinstance(obj, h5py.Dataset):
+            return
+        unit = obj.attrs.get('units')
+        if unit is None:
+            return
+        datasets[path] = {
+            'shape': obj.shape,
+            'dtype': obj.dtype.str,
+            'units': _decode(unit),
+            'scales': [dim[0].name.rsplit('/', 1)[-1] if len(dim) else None
+                       for dim in obj.dims],
+            'is_scale': h5py.h5ds.is_scale(obj.id)}
+
+    f.file.visititems(visit)
+    return {'properties': dict(f.get_properties()),
+            'datasets': datasets}
+
+
+class datafile_collection:
+    """A read-only collection of datafiles, opened concurrently.
+
+    The manifest is a dictionary from filename to the output of
+    :py:func:`read_manifest`. The files are kept open until the collection
+    is closed, so that datasets can be fetched without opening them again.
+    """
+    def __init__(self, filenames, max_workers=None):
+        self.filenames = list(filenames)
+        self.max_workers = max_workers or min(32, 4 * (os.cpu_count() or 1))
+        self.files = {}
+        self.manifest = {}
+
+        def open_file(filename):
+            f = datafile(filename, 'r')
+            return filename, f, read_manifest(f)
+
+        try:
+            with ThreadPoolExecutor(self.max_workers) as pool:
+                for filename, f, manifest in pool.map(
+                        open_file, self.filenames):
+                    self.files[filename] = f
+                    self.manifest[filename] = manifest
+        except BaseException:
+            self.close()
+            raise
+
+    @staticmethod
+    def from_directory(directory, pattern='.h5', **kwargs):
+        """Open all files in `directory` whose names end in `pattern`."""
+        return datafile_collection(
+            sorted(os.path.join(directory, name)
+                   for name in os.listdir(directory)
+                   if name.endswith(pattern)), **kwargs)
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        self.files = {}
+
+    def find(self, path):
+        """List the files that contain a dataset at `path` ('group/name')."""
+        return [filename for filename in self.filenames
+                if path in self.manifest[filename]['datasets']]
+
+    def get_dataset(self, filename, path):
+        """Read the dataset at `path` ('group/name') from `filename`."""
+        return self.get_lazy_dataset(filename, path).read()
+
+    def get_lazy_dataset(self, filename, path):
+        group, name = _split_path(path)
+        return self.files[filename].get_group(group).get_lazy_dataset(name)
+
+    def get_datasets(self, items):
+        """Read several datasets concurrently. `items` is a sequence of
+        `(filename, path)` pairs; returns a list of Quantities in the same
+        order."""
+        with ThreadPoolExecutor(self.max_workers) as pool:
+            return list(pool.map(lambda item: self.get_dataset(*item), items))
+
+    # Utility functions for use in a with: statement
+    def __enter__(self):
+        return self
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _split_path(path):
+    group, _, name = path.rpartition('/')
+    return group or '/', name
+
+
+class datafile_index:
+    """Persistent index of the datafiles in a directory.
+
+    The index is stored as JSON in `directory/index_name`. An entry is kept
+    for every file ending in `pattern`, holding its modification time and
+    size, its properties, and the manifest of its datasets (see
+    :py:func:`read_manifest`); for dimension scales, the minimum and
+    maximum value is stored as well. :py:meth:`update` only opens the files
+    that changed since the last update.
+    """
+    def __init__(self, directory, pattern='.h5',
+                 index_name='.cslib_index.json'):
+        self.directory = directory
+        self.pattern = pattern
+        self.filename = os.path.join(directory, index_name)
+        self.entries = {}
+
+        if os.path.exists(self.filename):
+            with open(self.filename) as f:
+                self.entries = json.load(f)['files']
+
+    def update(self):
+        """Bring the index up to date with the directory, and save it if
+        anything changed. Returns the list of files that were (re)read."""
+        names = sorted(name for name in os.listdir(self.directory)
+                       if name.endswith(self.pattern))
+        changed = []
+        entries = {}
+        for name in names:
+            stat = os.stat(os.path.join(self.directory, name))
+            entry = self.entries.get(name)
+            if entry is None or entry['mtime'] != stat.st_mtime_ns \
+                    or entry['size'] != stat.st_size:
+                entry = self._read_entry(name)
+                entry['mtime'] = stat.st_mtime_ns
+                entry['size'] = stat.st_size
+                changed.append(name)
+            entries[name] = entry
+
+        if changed or set(entries) != set(self.entries):
+            self.entries = entries
+            self.save()
+        return changed
+
+    def save(self):
+        tmp = self.filename + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'version': 1, 'files': self.entries}, f,
+                      separators=(',', ':'))
+        os.replace(tmp, self.filename)
+
+    def _read_entry(self, name):
+        with datafile(os.path.join(self.directory, name), 'r') as f:
+            manifest = read_manifest(f)
+            for path, entry in manifest['datasets'].items():
+                entry['shape'] = list(entry['shape'])
+                if entry['is_scale'] and entry['shape'] and entry['shape'][0]:
+                    data = f.file[path][()]
+                    entry['min'] = float(data.min())
+                    entry['max'] = float(data.max())
+
+        manifest['properties'] = {
+            key: _encode_property(value)
+            for key, value in manifest['properties'].items()}
+        return manifest
+
+    def properties(self, name):
+        """The properties of file `name`, as stored in the datafile."""
+        return {key: _decode_property(value) for key, value
+                in self.entries[name]['properties'].items()}
+
+    def find(self, path, ranges=None):
+        """List the files that contain a dataset at `path` ('group/name').
+
+        `ranges` is an optional dictionary from dimension scale names to
+        `(low, high)` Quantities; only files where the scale of the dataset
+        covers at least that range are listed. For example::
+
+            index.find('elastic/cs', {'energy': (1 * units.eV,
+                                                 10 * units.keV)})
+        """
+        ranges = ranges or {}
+        group = path.rpartition('/')[0]
+        factors = {}
+
+        def in_units(value, unit):
+            key = (str(value.units), unit)
+            if key not in factors:
+                factors[key] = units.Quantity(1, value.units) \
+                    .to(_parse_units(unit)).magnitude
+            return value.magnitude * factors[key]
+
+        def covers(datasets, scale, low, high):
+            entry = datasets.get(scale if not group
+                                 else group + '/' + scale)
+            if entry is None or 'min' not in entry:
+                return False
+            return entry['min'] <= in_units(low, entry['units']) and \
+                entry['max'] >= in_units(high, entry['units'])
+
+        result = []
+        for name, entry in sorted(self.entries.items()):
+            datasets = entry['datasets']
+            if path not in datasets:
+                continue
+            scales = datasets[path]['scales']
+            if all(scale in scales and covers(datasets, scale, low, high)
+                   for scale, (low, high) in ranges.items()):
+                result.append(os.path.join(self.directory, name))
+        return result
+
+
+def _encode_property(value):
+    if hasattr(value, 'units'):
+        return {'value': float(value.magnitude), 'units': str(value.units)}
+    if isinstance(value, str):
+        return value
+    return value.item() if hasattr(value, 'item') else value
+
+
+def _decode_property(value):
+    if isinstance(value, dict):
+        return units.Quantity(value['value'], _parse_units(value['units']))
+    return value
@@ -1,7 +1,10 @@
 from collections import OrderedDict
 from functools import reduce
+from itertools import (chain, islice)
 
 import io
+import re
+import warnings
 import numpy as np
 
 from . import units as ur
@@ -17,7 +20,16 @@ class DataFrame(object):
     row based access; however, it is optimised to handle entire columns
     of data more efficiently.
 
-    Rows start counting at 0. Every column must have a unit."""
+    Rows start counting at 0. Every column must have a unit.
+
+    The data is either stored as a single structured array (row store), or,
+    for a DataFrame created with :py:meth:`from_columns` or
+    :py:meth:`to_columns`, as one contiguous array per column (column
+    store). Either way, columns are returned as Quantities that are
+    read-only views of the data; use `.copy()` or `.to()` for a column to
+    modify. Slicing rows gives a new DataFrame that
+    shares its data with this one. In a column store, the `data` attribute
+    is assembled on request."""
     def __init__(self, data, units=None, comments=None):
         self.data = data
         if units:
@@ -28,17 +40,206 @@ class DataFrame(object):
         self.comments = comments
         self.unit_dict = OrderedDict(zip(self.data.dtype.names, self.units))
 
+    @staticmethod
+    def from_columns(columns, comments=None):
+        """Create a column store DataFrame from `(name, Quantity)` pairs,
+        or a dictionary of Quantities. Contiguous columns are not copied."""
+        if hasattr(columns, 'items'):
+            columns = columns.items()
+        columns = list(columns)
+        return DataFrame._from_arrays(
+            [name for name, _ in columns],
+            [np.ascontiguousarray(q.magnitude) for _, q in columns],
+            [q.units for _, q in columns], comments)
+
+    @staticmethod
+    def _from_arrays(names, arrays, units, comments):
+        obj = DataFrame.__new__(DataFrame)
+        obj._data = None
+        obj._columns = OrderedDict(zip(names, arrays))
+        obj.units = list(units)
+        obj.comments = comments
+        obj.unit_dict = OrderedDict(zip(names, obj.units))
+        return obj
+
+    @staticmethod
+    def from_text(f, delimiter=None, chunk_size=None):
+        """Read a DataFrame from text with a `# name (unit), ...` header, as
+        written by `str(df)`. `f` is a filename or an open text file.
+
+        Leading comment lines before the header are kept as comments. The
+        numbers are parsed in bulk by the C parser of `np.loadtxt`, or
+        `chunk_size` lines at a time. `delimiter` is None for whitespace
+        separated data, or e.g. ',' for CSV."""
+        if isinstance(f, str):
+            with open(f) as fi:
+                return DataFrame.from_text(fi, delimiter, chunk_size)
+
+        comments = []
+        line = f.readline()
+        while line.startswith('#'):
+            comments.append(line[1:].strip())
+            line = f.readline()
+        if not comments:
+            raise ValueError('Missing "# name (unit), ..." header.')
+        names, units = _parse_header(comments.pop())
+
+        blocks = []
+        lines = chain([line], f) if chunk_size is None \
+            else [line] + list(islice(f, chunk_size - 1))
+        while line:
+            blocks.append(_parse_block(lines, len(names), delimiter))
+            if chunk_size is None:
+                break
+            lines = list(islice(f, chunk_size))
+            line = lines[0] if lines else ''
+
+        if len(blocks) == 1:
+            values = blocks[0]
+        else:
+            values = np.concatenate(
+                blocks or [np.empty((0, len(names)))])
+        # View the [rows, columns] array as a structured array; no copy.
+        data = np.ascontiguousarray(values).view(
+            [(n, float) for n in names])[:, 0]
+        return DataFrame(data, units, comments or None)
+
+    def to_datafile(self, group, chunks=True, **storage):
+        """Store the DataFrame in a :py:class:`cslib.datafile` group, with
+        every column in its own dataset, so that columns can be read
+        separately. The column order and the comments are stored as
+        attributes of the group. `chunks` and further keyword arguments set
+        the storage layout, as in `add_dataset`; by default, h5py chooses
+        the chunk size."""
+        for name in self.names:
+            group.add_dataset(name, self._column(name), None,
+                              chunks=chunks, **storage)
+        group.group.attrs['columns'] = [n.encode('utf-8')
+                                        for n in self.names]
+        if self.comments:
+            group.group.attrs['comments'] = [c.encode('utf-8')
+                                             for c in self.comments]
+
+    @staticmethod
+    def from_datafile(group, columns=None, rows=None):
+        """Load a DataFrame stored with :py:meth:`to_datafile`, as a column
+        store. Only the datasets of the given `columns` (all by default)
+        are read, and of these only the given `rows`: a slice or an array
+        of increasing indices."""
+        attrs = group.group.attrs
+        names = [_decode(n) for n in attrs['columns']]
+        if columns is not None:
+            unknown = set(columns) - set(names)
+            if unknown:
+                raise ValueError('Unknown columns: {}.'.format(
+                    ', '.join(sorted(unknown))))
+            names = list(columns)
+        comments = [_decode(c) for c in attrs['comments']] \
+            if 'comments' in attrs else None
+
+        rows = slice(None) if rows is None else rows
+        return DataFrame.from_columns(
+            [(n, group.get_lazy_dataset(n)[rows]) for n in names], comments)
+
+    def to_columns(self):
+        """Return a column store copy of this DataFrame."""
+        return DataFrame._from_arrays(
+            self.names, [np.array(self._array(n)) for n in self.names],
+            self.units, self.comments)
+
+    @property
+    def data(self):
+        if self._data is None:
+            data = np.empty(len(self), dtype=[
+                (n, a.dtype) for n, a in self._columns.items()])
+            for n, a in self._columns.items():
+                data[n] = a
+            return data
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        self._data = data
+        self._columns = None
+
+    @property
+    def names(self):
+        return list(self.unit_dict.keys())
+
+    def _array(self, name):
+        if self._columns is not None:
+            return self._columns[name]
+        return self._data[name]
+
+    def _column(self, name):
+        # A read-only view, so that in-place operations on a column raise
+        # instead of changing the table behind its units
+        view = self._array(name).view()
+        view.flags.writeable = False
+        return ur.Quantity(view, self.unit_dict[name])
+
+    def _rows(self, rows, names=None):
+        if isinstance(rows, (int, np.integer)):
+            # A single row gives a DataFrame of one row
+            n = len(self)
+            if not -n <= rows < n:
+                raise IndexError('Row {} out of range.'.format(rows))
+            rows = slice(rows % n, rows % n + 1)
+        names = self.names if names is None else names
+        units = [self.unit_dict[n] for n in names]
+        if self._columns is not None:
+            return DataFrame._from_arrays(
+                names, [self._columns[n][rows] for n in names],
+                units, self.comments)
+        data = self._data[rows]
+        if names != self.names:
+            data = data[names]
+        return DataFrame(data, units, self.comments)
+
     def __getitem__(self, x):
-        s = self.data[x]
         if isinstance(x, str):
-            return s * self.unit_dict[x]
+            return self._column(x)
         elif isinstance(x, tuple) and isinstance(x[1], int):
-            return s * self.units[x[1]]
+            return self._column(self.names[x[1]])[x[0]]
         elif isinstance(x, tuple) and isinstance(x[1], slice):
-            return DataFrame(s, self.units[x[1]])
+            return self._rows(x[0], self.names[x[1]])
+        else:
+            return self._rows(x)
+
+    def between(self, name, low=None, high=None):
+        """Boolean mask of the rows where `low <= column < high`. Either
+        bound may be None. The bounds are converted to the unit of the
+        column, rather than the other way around; use the mask to index the
+        DataFrame, as in `df[df.between('energy', 1 * units.eV)]`."""
+        column = self._array(name)
+        unit = self.unit_dict[name]
+        mask = np.ones(len(self), dtype=bool)
+        if low is not None:
+            mask &= column >= _in_units(low, unit)
+        if high is not None:
+            mask &= column < _in_units(high, unit)
+        return mask
+
+    def sort_by(self, name, reverse=False):
+        """Return a copy with the rows sorted on a column. The sort is
+        stable, also in reverse."""
+        column = self._array(name)
+        if reverse:
+            order = len(column) - 1 - np.argsort(column[::-1],
+                                                 kind='stable')[::-1]
+        else:
+            order = np.argsort(column, kind='stable')
+        return self._rows(order)
+
+    def groupby(self, name):
+        """Group the rows on the values of a column; see
+        :py:class:`GroupBy`."""
+        return GroupBy(self, name)
 
     def __len__(self):
-        return len(self.data)
+        if self._columns is not None:
+            return len(next(iter(self._columns.values()), ()))
+        return len(self._data)
 
     def __str__(self):
         of = io.BytesIO()
@@ -48,3 +249,101 @@ class DataFrame(object):
             for n, u in self.unit_dict.items()) + \
             '\n' + of.getvalue().decode()
 
+
+class GroupBy(object):
+    """Rows of a DataFrame grouped on the values of one column, as returned
+    by :py:meth:`DataFrame.groupby`. The rows are sorted on the key once;
+    every reduction then works on contiguous groups."""
+    def __init__(self, df, name):
+        self.df = df
+        self.name = name
+        column = df._array(name)
+        self._order = np.argsort(column, kind='stable')
+        key = column[self._order]
+        self._starts = np.flatnonzero(
+            np.r_[len(key) > 0, key[1:] != key[:-1]])
+        self.keys = key[self._starts]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def counts(self):
+        return np.diff(np.r_[self._starts, len(self._order)])
+
+    def reduce(self, f=np.add, columns=None):
+        """Reduce the other columns (or those in `columns`) per group, and
+        return a DataFrame with one row per key, sorted on the key. `f` is
+        a ufunc, such as `np.add`, `np.minimum` or `np.maximum`, or 'mean'.
+        The reduced columns keep their units, which is only meaningful for
+        reductions like these."""
+        names = [n for n in self.df.names if n != self.name] \
+            if columns is None else list(columns)
+        arrays = [self.keys]
+        for n in names:
+            values = self.df._array(n)[self._order]
+            if f == 'mean':
+                arrays.append(np.add.reduceat(values, self._starts)
+                              / self.counts())
+            else:
+                arrays.append(f.reduceat(values, self._starts))
+        return DataFrame._from_arrays(
+            [self.name] + names, arrays,
+            [self.df.unit_dict[n] for n in [self.name] + names],
+            self.df.comments)
+
+    def sum(self, columns=None):
+        return self.reduce(np.add, columns)
+
+    def mean(self, columns=None):
+        return self.reduce('mean', columns)
+
+    def min(self, columns=None):
+        return self.reduce(np.minimum, columns)
+
+    def max(self, columns=None):
+        return self.reduce(np.maximum, columns)
+
+
+def _in_units(value, unit):
+    """Magnitude of a scalar Quantity in `unit`; plain numbers are assumed
+    to be in that unit already."""
+    if hasattr(value, 'units'):
+        return value.to(unit).magnitude
+    return value
+
+
+_header_item = re.compile(r'\s*(\S+) \((.*)\)\s*$')
+
+
+def _parse_header(header):
+    names, units = [], []
+    for item in header.split(','):
+        match = _header_item.match(item)
+        if match is None:
+            raise ValueError('Cannot parse column "{}" in header.'
+                             .format(item.strip()))
+        names.append(match.group(1))
+        units.append(match.group(2))
+    return names, units
+
+
+def _decode(value):
+    """h5py returns string attributes as bytes or str, depending on its
+    version."""
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+def _parse_block(lines, n_columns, delimiter):
+    """Parse lines of numbers into an array of shape [rows, n_columns],
+    using the C parser of `np.loadtxt`."""
+    with warnings.catch_warnings():
+        # Blocks of only comments are fine.
+        warnings.simplefilter('ignore', UserWarning)
+        values = np.loadtxt(lines, delimiter=delimiter, comments='#',
+                            ndmin=2)
+    if values.size == 0:
+        return values.reshape(0, n_columns)
+    if values.shape[1] != n_columns:
+        raise ValueError('Data does not match the {} columns in the '
+                         'header.'.format(n_columns))
+    return values
@@ -1,16 +1,51 @@
+"""Serialisation of CSLib objects for Noodles.
+
+Numpy arrays are stored in the JSON records as Base64 ``.npy`` data. If
+the registry is given a directory, arrays larger than `inline_bytes` are
+instead written as ``.npy`` files to that directory, and loaded from there
+when decoding; the record only holds the file name. Quantities are stored
+as their magnitude and unit string, so that the magnitude of an array
+Quantity, and the arrays in a :py:class:`DCS` or :py:class:`DataFrame`, go
+through the same route. The files are named after a hash of their
+contents, so that equal arrays are stored once, and the records of equal
+inputs are equal. The files are not removed by CSLib, and the directory
+must only be writable by users that are trusted: existing files are
+reused as they are.
+
+A :py:class:`ResultCache` keeps the results of a function on disk, keyed
+on a hash of its arguments, so that a workflow can skip the jobs that it
+has run before."""
+
+from functools import update_wrapper
+import base64
+import hashlib
+import io
+import json
+import os
+import shutil
+import uuid
+
+import numpy as np
 from noodles.serial import (Serialiser, Registry, base)
-from noodles.serial.numpy import arrays_to_hdf5 as numpy_registry
+from noodles.serial.numpy import arrays_to_string as numpy_registry
 
 from .dataframe import DataFrame
 from .cs_table import DCS
+from .numeric import (CacheInfo, _hash_array)
 from .units import units
 
 
 class SerQuantity(Serialiser):
     def encode(self, obj, make_rec):
-        return make_rec(obj.to_tuple())
+        magnitude = obj.magnitude
+        if isinstance(magnitude, np.generic):
+            magnitude = magnitude.item()
+        return make_rec({'magnitude': magnitude, 'units': str(obj.units)})
 
     def decode(self, cls, data):
+        if isinstance(data, dict):
+            return units.Quantity(data['magnitude'], data['units'])
+        # Records written with Quantity.to_tuple()
         return units.Quantity.from_tuple(data)
 
 
@@ -19,7 +54,7 @@ class SerUnit(Serialiser):
         return make_rec(str(obj))
 
     def decode(self, cls, data):
-        return units(data)
+        return units.parse_units(data)
 
 
 class SerStandardObject(Serialiser):
@@ -34,6 +69,78 @@ class SerStandardObject(Serialiser):
         return cls(**data)
 
 
+class SerDCS(Serialiser):
+    """Serialise a :py:class:`DCS` together with its log-energy axis and
+    grid steps. Since the table was checked when it was created, decoding
+    restores it without checking the units and shapes again; as always,
+    the interpolator is only built when it is first needed. Records
+    without the `validated` flag go through the constructor."""
+    def __init__(self):
+        super(SerDCS, self).__init__(DCS)
+
+    def encode(self, obj, make_rec):
+        return make_rec({
+            'energy': obj.energy, 'q': obj.q, 'cs': obj.cs,
+            'log_energy': obj._log_energy,
+            'log_energy_step': _float_or_none(obj._log_energy_step),
+            'q_step': _float_or_none(obj._q_step),
+            'validated': True})
+
+    def decode(self, cls, data):
+        if not data.get('validated'):
+            return DCS(data['energy'], data['q'], data['cs'])
+        return DCS._restore(
+            data['energy'], data['q'], data['cs'], data['log_energy'],
+            data['log_energy_step'], data['q_step'])
+
+
+def _float_or_none(x):
+    return None if x is None else float(x)
+
+
+class SerArray(Serialiser):
+    """Serialise a Numpy array inline, as Base64 in the JSON record, if it
+    is smaller than `inline_bytes` or `directory` is None; otherwise
+    out-of-band, as a ``.npy`` file in `directory`."""
+    def __init__(self, directory, inline_bytes):
+        super(SerArray, self).__init__(np.ndarray)
+        self.directory = directory
+        self.inline_bytes = inline_bytes
+
+    def encode(self, obj, make_rec):
+        if self.directory is None or obj.nbytes < self.inline_bytes:
+            fo = io.BytesIO()
+            np.save(fo, obj, allow_pickle=False)
+            return make_rec({'npy': base64.b64encode(fo.getvalue()).decode()})
+
+        filename = os.path.join(self.directory, _hash_array(obj) + '.npy')
+        if not os.path.exists(filename):
+            os.makedirs(self.directory, exist_ok=True)
+            tmp = '{}.{}.tmp'.format(filename, uuid.uuid4().hex)
+            with open(tmp, 'wb') as f:
+                np.save(f, obj, allow_pickle=False)
+            os.replace(tmp, filename)
+        return make_rec({'filename': filename}, files=[filename])
+
+    def decode(self, cls, data):
+        if 'npy' in data:
+            return np.load(io.BytesIO(base64.b64decode(data['npy'])))
+        return np.load(data['filename'])
+
+
+class SerArrayHash(Serialiser):
+    """Replace a Numpy array by a hash of its bytes, dtype and shape. Used
+    for cache keys only; these records cannot be decoded."""
+    def __init__(self):
+        super(SerArrayHash, self).__init__(np.ndarray)
+
+    def encode(self, obj, make_rec):
+        return make_rec({'sha256': _hash_array(obj)})
+
+    def decode(self, cls, data):
+        raise TypeError('Array hashes cannot be decoded.')
+
+
 def quantity_hook(obj):
     if isinstance(obj, units.Quantity):
         return '<quantity>'
@@ -47,17 +154,156 @@ def quantity_hook(obj):
     return None
 
 
-def registry():
+def registry(directory=None, inline_bytes=2**12):
+    """Serialisation registry for CSLib objects. By default the records
+    are self-contained. If `directory` is given, arrays of `inline_bytes`
+    or more are written there instead; all workers that decode the records
+    need access to it, and it should not be writable by others."""
     return Registry(
         parent=base() + numpy_registry(),
         types={
+            np.ndarray: SerArray(directory, inline_bytes),
             DataFrame: SerStandardObject(
                 DataFrame, ['data', 'units', 'comments']),
-            DCS: SerStandardObject(
-                DCS, ['energy', 'q', 'cs'])
+            DCS: SerDCS()
         },
         hooks={
             '<quantity>': SerQuantity('<quantity>'),
             '<unit>': SerUnit('<unit>')
         },
         hook_fn=quantity_hook)
+
+
+class ResultCache(object):
+    """Keep the results of a function on disk, keyed on a hash of the
+    function name, `version` and arguments; arguments can be anything that
+    :py:func:`registry` serialises, such as Settings, Quantities, arrays and
+    DCS tables. Arrays are hashed from their bytes, not from their JSON
+    encoding.
+
+    Every result is stored in its own subdirectory of `directory`, as JSON
+    with its arrays next to it. When the results take up more than
+    `max_bytes`, the least recently used ones are removed. Several caches,
+    also in other processes, may share a directory.
+
+    Use it to wrap the functions of a Noodles workflow, so that a job
+    whose arguments did not change returns immediately::
+
+        @schedule
+        @ResultCache.decorate('dcs-cache')
+        def elastic_dcs(settings, energy):
+            ...
+
+    The function must not depend on anything but its arguments; change
+    `version` when its code changes. Results are keyed on the qualified
+    name of the function, so two lambdas in the same scope share their
+    results, as do all instances of a callable class; give each a
+    different `version`."""
+    def __init__(self, f, directory, max_bytes=2**32, version=None):
+        update_wrapper(self, f, updated=())
+        self.f = f
+        self.directory = directory
+        self.max_bytes = max_bytes
+        qualname = getattr(f, '__qualname__', type(f).__qualname__)
+        self.name = '{}.{}:{}'.format(f.__module__, qualname, version)
+        self.hits = 0
+        self.misses = 0
+        self._registry = registry()
+        self._hash_registry = self._registry + Registry(
+            types={np.ndarray: SerArrayHash()})
+
+    @staticmethod
+    def decorate(directory, max_bytes=2**32, version=None):
+        """Decorator that wraps a function in a :py:class:`ResultCache`."""
+        def _decorate(f):
+            return ResultCache(f, directory, max_bytes, version)
+        return _decorate
+
+    def key(self, *args, **kwargs):
+        """The hash under which the result for these arguments is kept."""
+        rec = self._hash_registry.deep_encode(
+            {'function': self.name, 'args': list(args), 'kwargs': kwargs})
+        return hashlib.sha256(
+            json.dumps(rec, sort_keys=True).encode()).hexdigest()
+
+    def __call__(self, *args, **kwargs):
+        key = self.key(*args, **kwargs)
+        path = os.path.join(self.directory, key)
+        try:
+            with open(os.path.join(path, 'result.json')) as f:
+                value = self._registry.from_json(f.read(), deref=True)
+        except FileNotFoundError:
+            pass
+        else:
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                pass
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        value = self.f(*args, **kwargs)
+        self._store(path, value)
+        return value
+
+    def _store(self, path, value):
+        # The arrays go next to the JSON; the JSON is written last, so that
+        # an entry is complete once it exists.
+        text = registry(path).to_json(value)
+        os.makedirs(path, exist_ok=True)
+        filename = os.path.join(path, 'result.json')
+        tmp = '{}.{}.tmp'.format(filename, uuid.uuid4().hex)
+        with open(tmp, 'w') as f:
+            f.write(text)
+        os.replace(tmp, filename)
+        self._evict(keep=path)
+
+    def _entries(self):
+        """List (last use, size, path) of the stored results. Entries that
+        other processes remove while we look are skipped."""
+        try:
+            entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return []
+
+        result = []
+        for entry in entries:
+            try:
+                if not entry.is_dir():
+                    continue
+                mtime = entry.stat().st_mtime
+                size = sum(_file_size(f) for f in os.scandir(entry.path))
+            except FileNotFoundError:
+                continue
+            result.append((mtime, size, entry.path))
+        return result
+
+    def _evict(self, keep):
+        entries = sorted(self._entries())
+        nbytes = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if nbytes <= self.max_bytes:
+                break
+            if path != keep:
+                shutil.rmtree(path, ignore_errors=True)
+                nbytes -= size
+
+    def cache_info(self):
+        entries = self._entries()
+        return CacheInfo(self.hits, self.misses, len(entries),
+                         sum(size for _, size, _ in entries), self.max_bytes)
+
+    def cache_clear(self):
+        """Remove all results in the directory, also those of other
+        functions."""
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.hits = 0
+        self.misses = 0
+
+
+def _file_size(entry):
+    try:
+        return entry.stat().st_size
+    except FileNotFoundError:
+        return 0
@@ -1,12 +1,15 @@
 from functools import (
-    reduce)
+    reduce, update_wrapper)
+from collections import (OrderedDict, namedtuple)
+import hashlib
 
 import numpy as np
 from numpy import (log)
-from scipy.integrate import (romberg)
-from scipy.interpolate import (interp1d)
+from scipy.integrate import (quad)
 from scipy.optimize import (brentq)
 
+from .units import (units)
+
 
 def identity(x):
     return x
@@ -21,24 +24,7 @@ def compose(*f):
 def interpolate_f(f1, f2, h, a, b):
     """Interpolate two functions `f1` and `f2` using interpolation
     function `h`, which maps [0,1] to [0,1] one-to-one."""
-    def g(x):
-        y1 = f1(x)
-        y2 = f2(x)
-
-        # Convert units and strip, to keep pint happy
-        units = y1.units
-        y2 = y2.to(units).magnitude
-        y1 = y1.magnitude
-
-        u = np.clip((x - a) / (b - a), 0.0, 1.0)
-        w = h(u)
-        ym = (1 - w) * y1 + w * y2
-
-        return np.where(
-            x < a, y1, np.where(
-                x > b, y2, ym)) * units
-
-    return g
+    return _Blend(f1, f2, h, lambda x: (x - a) / (b - a))
 
 
 def log_interpolate_f(f1, f2, h, a, b):
@@ -48,26 +34,78 @@ def log_interpolate_f(f1, f2, h, a, b):
     assert callable(f2)
     assert callable(h)
 
-    def weight(x):
-        return np.clip(log(x / a) / log(b / a), 0.0, 1.0)
+    return _Blend(f1, f2, h, lambda x: log(x / a) / log(b / a))
+
+
+class _Blend(object):
+    """Evaluate `f1(x)` where `u(x) < 0`, `f2(x)` where `u(x) > 1`, and
+    blend the two with weight `h(u)` in between. Each function is only
+    evaluated on the points where it contributes. The result has the units
+    of `f1`. When `f1` or `f2` is itself a blend, its result is passed on
+    as a plain array and a unit, rather than as a Quantity that is then
+    converted."""
+    def __init__(self, f1, f2, h, u):
+        self.f1 = f1
+        self.f2 = f2
+        self.h = h
+        self.u = u
+
+    def __call__(self, x):
+        return units.Quantity(*self.evaluate(x))
+
+    def evaluate(self, x):
+        """Return the result as a tuple `(magnitude, unit)`."""
+        u = self.u(x)
+        if hasattr(u, 'units'):
+            u = u.to('dimensionless').magnitude
+        shape = np.shape(u)
+        u = np.atleast_1d(u)
+        if hasattr(x, 'units'):
+            x = units.Quantity(np.atleast_1d(x.magnitude), x.units)
+        else:
+            x = np.atleast_1d(x)
 
-    def g(x):
-        y1 = f1(x)
-        y2 = f2(x)
+        below, above = u < 0, u > 1
+        inside = ~(below | above)
+        use_1, use_2 = ~above, ~below
 
-        # Convert units and strip, to keep pint happy
-        units = y1.units
-        y2 = y2.to(units).magnitude
-        y1 = y1.magnitude
+        # For empty input, f1 is still called to give the units
+        y1 = _evaluate(self.f1, x, use_1) \
+            if use_1.any() or u.size == 0 else None
+        y2 = _evaluate(self.f2, x, use_2) if use_2.any() else None
+        unit = (y1 if y1 is not None else y2)[1]
 
-        u = np.clip(log(x / a) / log(b / a), 0.0, 1.0)
-        w = h(u)
-        ym = (1 - w) * y1 + w * y2
+        result = np.empty(u.shape)
+        if y1 is not None:
+            y1 = np.broadcast_to(_to_unit(*y1, unit), use_1.sum())
+            result[use_1] = y1
+        if y2 is not None:
+            y2 = np.broadcast_to(_to_unit(*y2, unit), use_2.sum())
+            result[use_2] = y2
 
-        return np.where(
-            x < a, y1, np.where(
-                x > b, y2, ym)) * units
-    return g
+        if inside.any():
+            w = self.h(u[inside])
+            result[inside] = (1 - w) * y1[inside[use_1]] \
+                + w * y2[inside[use_2]]
+
+        return result.reshape(shape), unit
+
+
+def _evaluate(f, x, mask):
+    """Evaluate `f` on the points of `x` selected by `mask`, as a tuple
+    `(magnitude, unit)`."""
+    if not mask.all():
+        x = x[mask]
+    if isinstance(f, _Blend):
+        return f.evaluate(x)
+    y = f(x)
+    return y.magnitude, y.units
+
+
+def _to_unit(magnitude, unit, target):
+    if unit == target:
+        return magnitude
+    return units.Quantity(magnitude, unit).to(target).magnitude
 
 
 def loglog_interpolate(x, y, bounds_error=None, fill_value='extrapolate'):
@@ -77,13 +115,306 @@ def loglog_interpolate(x, y, bounds_error=None, fill_value='extrapolate'):
     If fill_value is equal to 'extrapolate', out-of-bounds accesses are
     extrapolated on a log-log scale. Otherwise, if bounds_error is False,
     out-of-bounds accesses are filled with fill_value. If bounds_error is
-    True, an error is raised for out-of-bounds accesses."""
+    True, an error is raised for out-of-bounds accesses.
+
+    Returns a :py:class:`LogLogInterpolator`."""
+    return LogLogInterpolator(x, y, bounds_error, fill_value)
+
+
+class LogLogInterpolator(object):
+    """Piecewise power-law interpolation between data points `x`, `y`;
+    see :py:func:`loglog_interpolate` for the meaning of the arguments.
+
+    The logarithms of the data points and the slope of every segment are
+    computed once, and lookups use :py:func:`numpy.searchsorted`. Calling
+    the object converts a Quantity to the units of `x` and returns a
+    Quantity; :py:meth:`evaluate` works on plain arrays in the units
+    `x_units` and `y_units` and does not involve Pint at all.
+
+    A `fill_value` other than 'extrapolate' is in the units of `y`. It may
+    also be a tuple `(below, above)`."""
+    def __init__(self, x, y, bounds_error=None, fill_value='extrapolate'):
+        self.x_units = x.units
+        self.y_units = y.units
+
+        order = np.argsort(x.magnitude)
+        self.log_x = np.log(np.asarray(x.magnitude, dtype=float)[order])
+        self.log_y = np.log(np.asarray(y.magnitude, dtype=float)[order])
+        self.slope = np.diff(self.log_y) / np.diff(self.log_x)
+
+        self.extrapolate = isinstance(fill_value, str) and \
+            fill_value == 'extrapolate'
+        if bounds_error is None:
+            bounds_error = not self.extrapolate
+        self.bounds_error = bounds_error
+
+        if self.extrapolate:
+            self.fill_value = None
+        elif isinstance(fill_value, tuple):
+            self.fill_value = fill_value
+        else:
+            self.fill_value = (fill_value, fill_value)
+
+    def __call__(self, x_points):
+        if hasattr(x_points, 'units'):
+            x_points = x_points.to(self.x_units).magnitude
+        return units.Quantity(self.evaluate(x_points), self.y_units)
+
+    def evaluate(self, x):
+        """Interpolate at `x`, a plain array in units of `self.x_units`,
+        returning a plain array in units of `self.y_units`."""
+        log_x = np.log(x)
+        i = np.searchsorted(self.log_x, log_x) - 1
+        i = np.clip(i, 0, self.slope.size - 1)
+
+        result = log_x - self.log_x[i]
+        result *= self.slope[i]
+        result += self.log_y[i]
+        result = np.exp(result)
+
+        if self.bounds_error or not self.extrapolate:
+            below = log_x < self.log_x[0]
+            above = log_x > self.log_x[-1]
+            if self.bounds_error and (np.any(below) or np.any(above)):
+                raise ValueError(
+                    "A value in x_new is outside the interpolation range.")
+            if not self.extrapolate:
+                result = np.where(below, self.fill_value[0], result)
+                result = np.where(above, self.fill_value[1], result)
+
+        return result
+
+
+def cumulative_integral(x, y):
+    """Cumulative integral of `y` over the (possibly non-uniform) grid `x`,
+    along the last axis of `y`. The result has the same shape as `y` and
+    starts at zero.
+
+    Each interval is integrated with the average of the two quadratics
+    through its neighbouring points (the cumulative form of Simpson's rule);
+    the first and last interval use the single quadratic available. Grids
+    of two points fall back to the trapezoid rule."""
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    h = np.diff(x)
+
+    if x.size < 3:
+        parts = (y[..., 1:] + y[..., :-1]) * h / 2
+    else:
+        # Integral over [x0, x1] of the quadratic through x0, x1, x2
+        h1, h2 = h[:-1], h[1:]
+        H = h1 + h2
+        forward = h1 * (3*H - h1) / (6*H) * y[..., :-2] \
+            + h1 * (3*H - 2*h1) / (6*h2) * y[..., 1:-1] \
+            - h1**3 / (6*H*h2) * y[..., 2:]
+        # Integral over [x1, x2] of the same quadratic
+        backward = -h2**3 / (6*H*h1) * y[..., :-2] \
+            + h2 * (3*H - 2*h2) / (6*h1) * y[..., 1:-1] \
+            + h2 * (3*H - h2) / (6*H) * y[..., 2:]
+
+        parts = np.empty(y.shape[:-1] + h.shape)
+        parts[..., :-1] = forward
+        parts[..., -1] = backward[..., -1]
+        parts[..., 1:-1] = (forward[..., 1:] + backward[..., :-1]) / 2
+
+    result = np.zeros(y.shape)
+    np.cumsum(parts, axis=-1, out=result[..., 1:])
+    return result
+
+
+def inverse_cdf(x, pdf, p):
+    """Invert the cumulative distribution of a tabulated probability
+    density, for many densities at once.
+
+    :param x: 1d grid of `K` points.
+    :param pdf: array of shape [..., K] with (unnormalised) densities on
+        `x`; each row along the last axis is treated separately.
+    :param p: 1d array of probabilities in [0, 1].
+    :return: tuple `(icdf, total)`, with `icdf` of shape [..., len(p)]
+        and `total` the integral of each row, of shape [...]. Rows that
+        integrate to zero give NaN.
+
+    The CDF is integrated with :py:func:`cumulative_integral`. Inside an
+    interval, the density is taken to be linear, so that the CDF is
+    quadratic and can be inverted exactly."""
+    x = np.asarray(x, dtype=float)
+    pdf = np.asarray(pdf, dtype=float)
+    p = np.asarray(p, dtype=float)
+    K = x.size
+
+    cdf = cumulative_integral(x, pdf)
+    total = cdf[..., -1].copy()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cdf /= total[..., None]
+    # Guard against tiny negative steps from the quadratic rule
+    np.maximum.accumulate(cdf, axis=-1, out=cdf)
+
+    # Search all rows in one go by shifting row `i` by `2*i`; the
+    # normalised CDF of each row lies in [0, 1].
+    rows = cdf.reshape(-1, K)
+    # Rows that integrate to zero are NaN, which would break the ordering
+    # of the shifted array; search a placeholder and blank them later.
+    invalid = ~np.all(np.isfinite(rows), axis=-1)
+    rows[invalid] = np.linspace(0, 1, K)
+    i = np.arange(rows.shape[0])[:, None]
+    flat = (rows + 2*i).ravel()
+    target = p[None, :] + 2*i
+    j = np.searchsorted(flat, target.ravel()).reshape(target.shape) - i*K
+    j = np.clip(j, 1, K - 1)
+
+    f = pdf.reshape(-1, K)
+    c0, c1 = rows[i, j-1], rows[i, j]
+    f0, f1 = f[i, j-1], f[i, j]
+    x0, h = x[j-1], x[j] - x[j-1]
+
+    # Map the step to the trapezoid mass of the interval, then solve
+    # c0 + f0*t + (f1 - f0)*t**2/(2h) = p for t, in a stable form.
+    with np.errstate(invalid='ignore', divide='ignore'):
+        dp = (p[None, :] - c0) / (c1 - c0) * (f0 + f1) * h / 2
+        dp = np.where(c1 > c0, dp, 0)
+        disc = np.sqrt(np.maximum(f0**2 + 2 * (f1 - f0) * dp / h, 0))
+        denom = f0 + disc
+        t = np.where(denom > 0, 2 * dp / denom, 0)
+
+    icdf = x0 + np.clip(t, 0, h)
+    icdf[invalid] = np.nan
+    return icdf.reshape(pdf.shape[:-1] + p.shape), total
+
+
+def inverse_cdf_table(f, a, b, n, n_grid=None):
+    """Tabulate the inverse cumulative distribution of the (unnormalised)
+    probability density `f` on [a, b], at `n` equally spaced probabilities.
+    Returns an array of shape [n, 2], with rows `(p, x(p))`.
+
+    By default every point is computed by adaptive quadrature and root
+    finding, which is slow but accurate to near machine precision.
+
+    If `n_grid` is given, `f` is evaluated once on a grid of `n_grid`
+    points and the table is computed with :py:func:`inverse_cdf`. In this
+    case `f` may return an array of shape [..., n_grid], for instance one
+    row per energy, giving a table of shape [..., n, 2]."""
+    p = np.linspace(0.0, 1.0, n)
+
+    if n_grid is not None:
+        x = np.linspace(a, b, n_grid)
+        icdf, _ = inverse_cdf(x, f(x), p)
+        p = np.broadcast_to(p, icdf.shape)
+        return np.stack([p, icdf], axis=-1)
+
+    def cdf(x):
+        return quad(f, a, x, epsabs=0, limit=200)[0]
+
+    total = cdf(b)
+    x = np.empty(n)
+    x[0], x[-1] = a, b
+    for k in range(1, n - 1):
+        x[k] = brentq(lambda u: cdf(u) - p[k] * total, a, b, xtol=1e-15)
+    return np.stack([p, x], axis=-1)
+
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'size', 'nbytes',
+                                     'max_bytes'])
+
+
+class ArrayCache(object):
+    """Memoize a function of arrays and Quantities, such as a
+    :py:class:`DCS` or a :py:class:`LogLogInterpolator`.
+
+    Array arguments are keyed on a hash of their bytes, together with
+    dtype, shape and units, so equal grids hit the cache even if they are
+    different objects. Other arguments must be hashable. Results are
+    stored read-only, and the least recently used ones are evicted when
+    their total size exceeds `max_bytes`.
+
+    The function must not change between calls: a table that is modified
+    in place will keep returning cached values. Use :py:meth:`cache_info`
+    to see whether the cache pays off."""
+    def __init__(self, f, max_bytes=2**28):
+        update_wrapper(self, f, updated=())
+        self.f = f
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        self._entries = OrderedDict()
+
+    def __call__(self, *args, **kwargs):
+        key = (tuple(_cache_key(a) for a in args),
+               tuple(sorted((k, _cache_key(v)) for k, v in kwargs.items())))
+
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key][0]
+
+        self.misses += 1
+        value = _read_only(self.f(*args, **kwargs))
+        size = _nbytes(value)
+        if size <= self.max_bytes:
+            self._entries[key] = (value, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.nbytes -= evicted
+        return value
+
+    def cache_info(self):
+        return CacheInfo(self.hits, self.misses, len(self._entries),
+                         self.nbytes, self.max_bytes)
+
+    def cache_clear(self):
+        self._entries.clear()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+
+def memoize(max_bytes=2**28):
+    """Decorator that wraps a function in an :py:class:`ArrayCache`."""
+    def _memoize(f):
+        return ArrayCache(f, max_bytes)
+    return _memoize
+
+
+def _hash_array(a):
+    """Hash the bytes of an array, together with its dtype and shape."""
+    shape = np.shape(a)
+    # ascontiguousarray makes a 0-d array 1-d, so only take the bytes
+    a = np.ascontiguousarray(a)
+    h = hashlib.sha256()
+    h.update(str(a.dtype.descr).encode())
+    h.update(str(shape).encode())
+    h.update(a.view(np.uint8).reshape(-1) if a.size else b'')
+    return h.hexdigest()
+
+
+def _cache_key(x):
+    if hasattr(x, 'units'):
+        return ('<quantity>', _cache_key(x.magnitude), str(x.units))
+    if isinstance(x, np.ndarray):
+        return ('<array>', _hash_array(x))
+    return x
+
 
-    interp_function = interp1d(np.log(x.magnitude), np.log(y.magnitude),
-        bounds_error = bounds_error, fill_value = fill_value)
+def _read_only(value):
+    """Make a result safe to hand out more than once. Arrays are copied
+    first, since they may belong to the function (an internal table, say),
+    which should neither be locked nor change the cached value later."""
+    if isinstance(value, tuple):
+        return tuple(_read_only(v) for v in value)
+    if hasattr(value, 'units'):
+        if isinstance(value.magnitude, np.ndarray):
+            return units.Quantity(_read_only(value.magnitude), value.units)
+        return value
+    if isinstance(value, np.ndarray):
+        value = value.copy()
+        value.flags.writeable = False
+    return value
 
-    def g(x_points):
-        return np.exp(interp_function(
-            np.log(x_points.to(x.units).magnitude))) * y.units
 
-    return g
+def _nbytes(value):
+    if isinstance(value, tuple):
+        return sum(_nbytes(v) for v in value)
+    if hasattr(value, 'units'):
+        return _nbytes(value.magnitude)
+    return getattr(value, 'nbytes', 0)
@@ -0,0 +1,182 @@
+"""Tabulate cross-sections over an energy grid on several cores.
+
+The energy axis is split in contiguous chunks, which are evaluated in a
+:py:mod:`concurrent.futures` pool and written into a single output array.
+With a process pool, the input arrays and the output live in shared
+memory, so they are not pickled for every task; the function itself is
+sent to every worker only once. If the function is a :py:class:`DCS`, its
+table is put in shared memory as well, rather than copied to every
+worker.
+
+The results are bit-identical to evaluating the function on the whole
+grid at once, as long as the function treats every energy independently,
+which is the case for :py:class:`DCS` objects and the interpolators in
+:py:mod:`cslib.numeric`. With processes, the function has to be picklable
+(no lambdas or closures)."""
+
+from concurrent.futures import (ProcessPoolExecutor, ThreadPoolExecutor)
+from multiprocessing import (shared_memory, resource_tracker)
+import os
+
+import numpy as np
+
+from .units import (units)
+from .cs_table import (DCS)
+
+
+def tabulate(f, energy, *args, max_workers=None, use_threads=False,
+             n_chunks=None):
+    """Evaluate `f(energy, *args)` by splitting `energy` along its first
+    axis over a pool of `max_workers` workers, and return the result as
+    a single Quantity.
+
+    :param f: function of one or more Quantities, returning a Quantity
+        whose first axis matches that of `energy`.
+    :param energy: Quantity to split over the workers.
+    :param args: further arguments, passed to every call in full.
+    :param max_workers: size of the pool; defaults to the number of CPUs.
+        With one worker, `f` is simply called on the whole grid.
+    :param use_threads: use a thread pool instead of a process pool.
+    :param n_chunks: number of chunks to split `energy` in; defaults to
+        four per worker."""
+    max_workers = max_workers or os.cpu_count() or 1
+    if max_workers == 1 or len(energy) < 2:
+        return f(energy, *args)
+
+    n_chunks = min(n_chunks or 4 * max_workers, len(energy))
+    bounds = np.linspace(0, len(energy), n_chunks + 1).astype(int)
+    chunks = list(zip(bounds[:-1], bounds[1:]))
+
+    # The first chunk fixes the units and shape of the result.
+    first = f(energy[chunks[0][0]:chunks[0][1]], *args)
+    unit = first.units
+    shape = (len(energy),) + first.shape[1:]
+
+    if use_threads:
+        out = np.empty(shape, dtype=first.magnitude.dtype)
+        out[chunks[0][0]:chunks[0][1]] = first.magnitude
+
+        def work(chunk):
+            start, stop = chunk
+            out[start:stop] = f(energy[start:stop], *args).to(unit).magnitude
+
+        with ThreadPoolExecutor(max_workers) as pool:
+            list(pool.map(work, chunks[1:]))
+
+        return units.Quantity(out, unit)
+
+    shared = []
+    try:
+        inputs = [_SharedArray.create(a, shared)
+                  for a in (energy,) + args]
+        result = _SharedArray.create(
+            units.Quantity(np.empty(shape, dtype=first.magnitude.dtype),
+                           unit), shared)
+        result.array()[chunks[0][0]:chunks[0][1]] = first.magnitude
+
+        if isinstance(f, DCS):
+            f = _SharedDCS(f, shared)
+
+        with ProcessPoolExecutor(
+                max_workers, initializer=_init_worker,
+                initargs=(f, inputs, result)) as pool:
+            list(pool.map(_work, chunks[1:]))
+
+        return units.Quantity(result.array().copy(), unit)
+    finally:
+        for shm in shared:
+            shm.close()
+            shm.unlink()
+
+
+def tabulate_dcs(f, energy, q, **kwargs):
+    """Tabulate a differential cross-section `f(E, q)` on the grid spanned
+    by `energy` and `q`, splitting the energy axis as in
+    :py:func:`tabulate`, and return it as a :py:class:`DCS`.
+
+    `f` is called with a column of energies and the full `q` row, and
+    should return the cross-section with shape [len(E), len(q)]; a
+    :py:class:`DCS` object can be passed directly."""
+    energy = energy.reshape([energy.size, 1])
+    return DCS(energy, q, tabulate(f, energy, q, **kwargs))
+
+
+class _SharedArray(object):
+    """Picklable reference to a Quantity (or plain array) stored in a
+    block of shared memory."""
+    def __init__(self, name, shape, dtype, unit):
+        self.name = name
+        self.shape = shape
+        self.dtype = dtype
+        self.unit = unit
+        self._shm = None
+
+    @staticmethod
+    def create(value, shared):
+        """Copy `value` into a new block of shared memory, which is
+        appended to `shared` for the caller to release."""
+        unit = str(value.units) if hasattr(value, 'units') else None
+        data = np.asarray(value.magnitude if unit is not None else value)
+        shm = shared_memory.SharedMemory(
+            create=True, size=max(data.nbytes, 1))
+        shared.append(shm)
+
+        ref = _SharedArray(shm.name, data.shape, data.dtype.str, unit)
+        ref._shm = shm
+        ref.array()[...] = data
+        return ref
+
+    def __getstate__(self):
+        return (self.name, self.shape, self.dtype, self.unit)
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def array(self):
+        if self._shm is None:
+            self._shm = shared_memory.SharedMemory(name=self.name)
+            # The creating process owns the block; keep the resource
+            # tracker from removing it when this worker exits.
+            resource_tracker.unregister(self._shm._name, 'shared_memory')
+        return np.ndarray(self.shape, dtype=self.dtype, buffer=self._shm.buf)
+
+    def value(self):
+        if self.unit is None:
+            return self.array()
+        return units.Quantity(self.array(), self.unit)
+
+
+class _SharedDCS(object):
+    """Picklable stand-in for a :py:class:`DCS`, with its arrays in shared
+    memory. Workers rebuild the table around them without copying."""
+    def __init__(self, dcs, shared):
+        self.energy, self.q, self.cs, self.log_energy = (
+            _SharedArray.create(a, shared)
+            for a in (dcs.energy, dcs.q, dcs.cs, dcs._log_energy))
+        self.steps = (dcs._log_energy_step, dcs._q_step)
+
+    def value(self):
+        return DCS._restore(self.energy.value(), self.q.value(),
+                            self.cs.value(), self.log_energy.value(),
+                            *self.steps)
+
+
+_worker = {}
+
+
+def _init_worker(f, inputs, result):
+    # Keep the shared arrays referenced for as long as the worker lives
+    _worker['shared'] = (f, inputs, result)
+    if isinstance(f, _SharedDCS):
+        f = f.value()
+    _worker['f'] = f
+    _worker['inputs'] = [a.value() for a in inputs]
+    _worker['result'] = result.array()
+    _worker['unit'] = units(result.unit).units
+
+
+def _work(chunk):
+    start, stop = chunk
+    energy, args = _worker['inputs'][0], _worker['inputs'][1:]
+    value = _worker['f'](energy[start:stop], *args)
+    _worker['result'][start:stop] = value.to(_worker['unit']).magnitude
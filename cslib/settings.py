@@ -54,6 +54,7 @@ a string::
 from functools import (reduce)
 from copy import (deepcopy)
 from collections import OrderedDict
+from collections.abc import Mapping
 import textwrap
 
 from ruamel import yaml
@@ -230,6 +231,111 @@ class Settings(OrderedDict):
 
         self[k] = v
 
+    def freeze(self):
+        """Return a read-only :py:class:`FrozenSettings` copy of these
+        settings, for fast access in inner loops. Missing entries that have
+        a default in the `Model` are filled in, without changing this
+        object."""
+        return FrozenSettings._from_settings(self)
+
+
+class FrozenSettings(Mapping):
+    """A read-only, compiled view of a :py:class:`Settings` tree, as
+    returned by :py:meth:`Settings.freeze`.
+
+    Every node stores all its entries, including nested ones under their
+    dotted key, in a flat dictionary, so that `frozen['beam.energy']` is
+    a single lookup. Iteration, `len` and `in` only see the keys of the
+    node itself. Entries whose key is an identifier are also stored in
+    `__slots__`, so that `frozen.beam.energy` is plain attribute access.
+    A missing attribute raises `AttributeError`, rather than returning a
+    `TemporaryEntry`.
+
+    Values other than nested settings, like arrays, are not copied."""
+    __slots__ = ('_flat', '_keys')
+
+    _classes = {}
+
+    @staticmethod
+    def _from_settings(settings):
+        items = OrderedDict(
+            (k, v.freeze() if isinstance(v, Settings) else v)
+            for k, v in OrderedDict.items(settings))
+
+        model = getattr(settings, '_model', None)
+        if model:
+            # Computed defaults may fill in other defaults; let them do so
+            # on a copy.
+            work = None
+            for k, entry in OrderedDict.items(model):
+                if k in items or not isinstance(entry, Type) \
+                        or entry.default is None:
+                    continue
+                default = entry.default
+                if callable(default):
+                    work = work or deepcopy(settings)
+                    default = default(work)
+                items[k] = default
+
+        flat = {}
+        for k, v in items.items():
+            flat[k] = v
+            if isinstance(v, FrozenSettings):
+                flat.update((k + '.' + sub, w) for sub, w in v._flat.items())
+
+        names = tuple(k for k in items if _is_slot_name(k))
+        if names not in FrozenSettings._classes:
+            FrozenSettings._classes[names] = type(
+                'FrozenSettings', (FrozenSettings,),
+                {'__slots__': names, '__module__': __name__})
+        obj = object.__new__(FrozenSettings._classes[names])
+        object.__setattr__(obj, '_flat', flat)
+        object.__setattr__(obj, '_keys', tuple(items))
+        for k in names:
+            object.__setattr__(obj, k, items[k])
+        return obj
+
+    def __getitem__(self, k):
+        return self._flat[k]
+
+    def __getattr__(self, k):
+        # Only called for entries without a slot
+        try:
+            return self._flat[k]
+        except KeyError:
+            raise AttributeError(k)
+
+    def __setattr__(self, k, v):
+        raise AttributeError('FrozenSettings are read-only.')
+
+    def __contains__(self, k):
+        # Like iteration, only the keys of this level
+        return k in self._keys
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def thaw(self):
+        """Return a mutable :py:class:`Settings` copy, without a model."""
+        return Settings(_data=[
+            (k, v.thaw() if isinstance(v, FrozenSettings) else v)
+            for k, v in ((k, self[k]) for k in self._keys)])
+
+    def __reduce__(self):
+        return (Settings.freeze, (self.thaw(),))
+
+    def __repr__(self):
+        return 'FrozenSettings({})'.format(
+            ', '.join('{}={!r}'.format(k, self[k]) for k in self._keys))
+
+
+def _is_slot_name(k):
+    return k.isidentifier() and not k.startswith('_') \
+        and not hasattr(FrozenSettings, k)
+
 
 def identity(x):
     return x
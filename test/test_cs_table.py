@@ -0,0 +1,178 @@
+from cslib import (units, DCS)
+import numpy as np
+
+
+def make_dcs():
+    energy = np.logspace(1, 4, 31) * units.eV
+    q = np.linspace(0, 5, 21) * units('1/nm')
+    cs = np.outer(np.sqrt(energy.magnitude), 1 + q.magnitude) \
+        * units('nm^2 * nm')
+    return DCS(energy, q, cs)
+
+
+def test_evaluate_matches_call():
+    dcs = make_dcs()
+    E = np.linspace(20, 5000, 100) * units.eV
+    q = np.linspace(0, 4, 100) * units('1/nm')
+
+    ref = dcs(E, q)
+    fast = dcs.evaluate(E.to('keV'), q.to('1/Å'))
+    raw = dcs.evaluate(E.magnitude, q.magnitude)
+
+    assert np.allclose(ref.magnitude, fast)
+    assert np.allclose(ref.magnitude, raw)
+
+
+def test_evaluate_grid():
+    dcs = make_dcs()
+    E = np.linspace(20, 5000, 7)
+    q = np.linspace(0, 4, 5)
+
+    grid = dcs.evaluate(E, q, grid=True)
+    assert grid.shape == (7, 5)
+    assert np.allclose(grid, dcs.evaluate(E[:, None], q[None, :]))
+    assert np.allclose(grid[3], dcs.evaluate(np.full(5, E[3]), q))
+
+
+def test_to_icdf():
+    energy = np.logspace(1, 3, 3) * units.eV
+    theta = np.linspace(0, np.pi, 1025) * units.rad
+    cs = np.outer([1, 2, 3], np.sin(theta.magnitude)) * units('nm^2/rad')
+    dcs = DCS(energy, theta, cs)
+
+    icdf, total = dcs.to_icdf(33)
+    p = np.linspace(0, 1, 33)
+    assert icdf.shape == (3, 33)
+    assert icdf.units == units.rad
+    assert np.allclose(icdf.magnitude, np.arccos(1 - 2*p)[None, :])
+    assert np.allclose(total.to('nm^2').magnitude, [2, 4, 6])
+
+
+def test_derived_tables_share_axes():
+    dcs = make_dcs()
+    combined = 2 * dcs + dcs
+    assert combined.energy is dcs.energy
+    assert combined.q is dcs.q
+    assert combined._interpolate_fn is None
+    assert np.allclose(combined.cs.magnitude, 3 * dcs.cs.magnitude)
+
+    E = np.linspace(20, 5000, 10) * units.eV
+    q = np.linspace(0, 4, 10) * units('1/nm')
+    assert np.allclose(combined(E, q).magnitude, 3 * dcs(E, q).magnitude)
+
+
+def test_linear_combination():
+    a, b = make_dcs(), 0.5 * make_dcs()
+    weights = [2, 300 * units('cm/m')]
+    result = DCS.linear_combination(weights, [a, b])
+    expected = weights[0] * a.cs + weights[1] * b.cs
+
+    assert result.cs.units == a.cs.units
+    assert np.allclose(result.cs.magnitude,
+                       expected.to(a.cs.units).magnitude)
+
+
+def test_in_place():
+    a = make_dcs()
+    cs = a.cs.magnitude.copy()
+    E = np.linspace(20, 5000, 10)
+    q = np.linspace(0, 4, 10)
+    before = a.evaluate(E, q)
+
+    a *= 2
+    a += make_dcs()
+    assert np.allclose(a.cs.magnitude, 3 * cs)
+    assert np.allclose(a.evaluate(E, q), 3 * before)
+
+    # Tables passed to the constructor are not changed in place
+    table = make_dcs().cs
+    b = DCS(a.energy, a.q, table)
+    c = DCS(a.energy, a.q, table)
+    b *= 2
+    b += c
+    assert np.array_equal(table.magnitude, cs)
+    assert np.array_equal(c.cs.magnitude, cs)
+    assert np.allclose(b.cs.magnitude, 3 * cs)
+
+
+def test_evaluate_matches_interpolator():
+    rng = np.random.RandomState(0)
+    axes = [
+        (np.logspace(0, 4, 50), np.linspace(0, 10, 40)),
+        (np.sort(rng.uniform(1, 1e4, 50)), np.sort(rng.uniform(0, 10, 40)))]
+
+    for energy, q in axes:
+        dcs = DCS(energy * units.eV, q * units('1/nm'),
+                  rng.random_sample((50, 40)) * units('nm^3'))
+        E = np.r_[rng.uniform(0.5, 2e4, 1000), energy,
+                  0, np.inf, energy[5]]
+        qs = np.r_[rng.uniform(-1, 11, 1000), q, q[:10], 1, 1, np.nan]
+
+        result = dcs.evaluate(E, qs)
+        expected = dcs.interpolate_fn((np.log(E), qs))
+        assert np.allclose(result, expected, equal_nan=True)
+        assert np.isnan(result[-1])
+        assert np.all(result[-3:-1] == 0)
+
+        # A scalar on one axis broadcasts against an array on the other
+        E_0, q_0 = 1.5 * energy[5], 0.5 * (q[5] + q[6])
+        for E_mixed, q_mixed in [(E_0, qs), (E, q_0)]:
+            result = dcs.evaluate(E_mixed, q_mixed)
+            E_b, q_b = np.broadcast_arrays(E_mixed, q_mixed)
+            expected = dcs.interpolate_fn((np.log(E_b), q_b))
+            assert result.shape == E_b.shape
+            assert np.allclose(result, expected, equal_nan=True)
+        assert np.allclose(
+            dcs(E_0 * units.eV, qs[:10] * units('1/nm')).magnitude,
+            dcs.interpolate_fn((np.log(E_0), qs[:10])))
+
+
+def test_evaluate_chunked(tmpdir):
+    dcs = make_dcs()
+    E = np.linspace(5, 2e4, 1001) * units.eV
+    q = np.linspace(0, 6, 1001) * units('1/nm')
+    expected = dcs.evaluate(E, q)
+
+    assert np.array_equal(dcs.evaluate(E, q, chunk_size=100), expected)
+
+    out = np.lib.format.open_memmap(
+        str(tmpdir.join('out.npy')), mode='w+', shape=(1001,))
+    result = dcs.evaluate(E.to('keV'), q, out=out, chunk_size=64)
+    assert result is out
+    assert np.allclose(out, expected)
+
+    grid = dcs.evaluate(E[::10], q[::20], grid=True, chunk_size=7)
+    assert np.array_equal(
+        grid, dcs.evaluate(E[::10], q[::20], grid=True))
+
+
+def test_save_load(tmpdir):
+    from cslib.datafile import datafile
+
+    filename = str(tmpdir.join('dcs.h5'))
+    dcs = make_dcs()
+    with datafile(filename, 'w') as f:
+        group = f.create_group('elastic')
+        dcs.save(group)
+        (2 * dcs).save(group, name='double', compression='gzip')
+
+    E = np.linspace(20, 5000, 100) * units.eV
+    q = np.linspace(0, 4, 100) * units('1/nm')
+    with datafile(filename, 'r') as f:
+        group = f.get_group('elastic')
+        loaded = DCS.load(group)
+        assert np.array_equal(loaded.cs.magnitude, dcs.cs.magnitude)
+        assert np.array_equal(loaded.energy.magnitude, dcs.energy.magnitude)
+
+        for name, factor in [('cs', 1), ('double', 2)]:
+            lazy = DCS.load(group, name, lazy=True)
+            assert lazy._cs is None
+            result = lazy(E[:3], q[:3])
+            assert result.units == dcs.cs.units
+            assert np.allclose(result.magnitude,
+                               factor * dcs(E[:3], q[:3]).magnitude)
+            assert np.allclose(lazy.evaluate(E, q, chunk_size=7),
+                               factor * dcs.evaluate(E, q))
+            assert np.allclose(lazy.evaluate(E[50], q),
+                               factor * dcs.evaluate(E[50], q))
+            assert lazy._cs is None
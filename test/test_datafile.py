@@ -0,0 +1,141 @@
+from cslib import units
+from cslib import datafile as datafile_module
+from cslib.datafile import datafile
+import numpy as np
+
+
+def write_file(filename, **kwargs):
+    energy = np.logspace(0, 4, 100) * units.eV
+    q = np.linspace(0, 1, 50) * units('1/nm')
+    cs = np.random.random((100, 50)) * units('nm^2/sr')
+
+    with datafile(filename, 'w') as f:
+        group = f.create_group('elastic')
+        group.add_scale('energy', energy)
+        group.add_scale('q', q)
+        group.add_dataset('dcs', cs, ('energy', 'q'), **kwargs)
+
+    return energy, q, cs
+
+
+def test_lazy_dataset(tmpdir):
+    filename = str(tmpdir.join('lazy.h5'))
+    energy, q, cs = write_file(filename)
+
+    with datafile(filename, 'r') as f:
+        group = f.get_group('elastic')
+        full = group.get_dataset('dcs')
+        assert full.units == cs.units
+        assert np.array_equal(full.magnitude, cs.magnitude)
+        full.magnitude[0, 0] = -1
+
+        dset = group.get_lazy_dataset('dcs')
+        assert dset.shape == (100, 50)
+        assert dset.memmap() is not None
+
+        rows = dset[10:20, :]
+        assert rows.units == cs.units
+        assert np.array_equal(rows.magnitude, cs.magnitude[10:20])
+        assert np.shares_memory(rows.magnitude, dset.memmap())
+        assert not rows.magnitude.flags.writeable
+
+        assert np.array_equal(
+            group.get_lazy_dataset('energy')[5].magnitude,
+            energy.magnitude[5])
+
+
+def test_read_through_memmap(tmpdir, monkeypatch):
+    filename = str(tmpdir.join('large.h5'))
+    energy, q, cs = write_file(filename)
+    monkeypatch.setattr(datafile_module, 'MEMMAP_READ_BYTES', cs.nbytes)
+
+    with datafile(filename, 'r') as f:
+        group = f.get_group('elastic')
+        dset = group.get_lazy_dataset('dcs')
+        full = dset.read()
+        assert dset._memmap is not None
+        assert full.units == cs.units
+        assert np.array_equal(full.magnitude, cs.magnitude)
+        assert not np.shares_memory(full.magnitude, dset.memmap())
+        full.magnitude[0, 0] = -1
+
+        # Smaller datasets are read by HDF5
+        scale = group.get_lazy_dataset('energy')
+        assert np.array_equal(scale.read().magnitude, energy.magnitude)
+        assert scale._memmap is None
+
+
+def test_storage_options(tmpdir):
+    for i, (kwargs, chunks) in enumerate([
+            # 655 rows of 400 bytes fit in CHUNK_BYTES; there are 100
+            ({'chunks': 'rows'}, (100, 50)),
+            ({'compression': 'gzip', 'shuffle': True}, None),
+            ({'compression': 'lzf', 'chunks': (10, 50)}, (10, 50))]):
+        filename = str(tmpdir.join('layout{}.h5'.format(i)))
+        energy, q, cs = write_file(filename, **kwargs)
+
+        with datafile(filename, 'r') as f:
+            group = f.get_group('elastic')
+            h5_dset = group.group['dcs']
+            assert h5_dset.chunks is not None
+            assert chunks is None or h5_dset.chunks == chunks
+            assert h5_dset.compression == kwargs.get('compression')
+
+            dset = group.get_lazy_dataset('dcs')
+            assert dset.memmap() is None
+            assert np.array_equal(dset[3:5].magnitude, cs.magnitude[3:5])
+
+
+def test_dataset_writer(tmpdir):
+    filename = str(tmpdir.join('stream.h5'))
+    energy = np.logspace(0, 4, 100) * units.eV
+    q = np.linspace(0, 1, 50) * units('1/nm')
+    cs = np.random.random((100, 50)) * units('nm^2/sr')
+
+    with datafile(filename, 'w') as f:
+        group = f.create_group('elastic')
+        group.add_scale('energy', energy)
+        group.add_scale('q', q)
+
+    with datafile(filename, 'a') as f:
+        group = f.get_group('elastic')
+        with group.create_dataset_writer(
+                'dcs', (50,), ('energy', 'q'), 'nm^2/sr',
+                flush_bytes=1000) as writer:
+            for i in range(0, 100, 30):
+                writer.append(cs[i:i+30].to('Å^2/sr'))
+            assert len(writer) == 100
+
+    with datafile(filename, 'r') as f:
+        group = f.get_group('elastic')
+        result = group.get_dataset('dcs')
+        assert result.units == cs.units
+        assert np.allclose(result.magnitude, cs.magnitude)
+
+        h5_dset = group.group['dcs']
+        assert h5_dset.chunks == (655, 50)
+        assert h5_dset.dims[0][0].name == group.scales['energy'].name
+        assert h5_dset.dims[1][0].name == group.scales['q'].name
+
+
+def test_properties(tmpdir):
+    filename = str(tmpdir.join('properties.h5'))
+    with datafile(filename, 'w') as f:
+        f.set_property('density', 2.33 * units('g/cm^3'))
+        f.set_property('name', 'silicon')
+        f.set_property('Z', 14)
+        f.set_property('fermi', 7.5)
+
+    with datafile(filename, 'a') as f:
+        assert f.get_property('name') == 'silicon'
+        assert f.get_property('Z') == 14
+        assert f.get_property('fermi') == 7.5
+        density = f.get_property('density')
+        assert density.units == units('g/cm^3').units
+        assert np.isclose(density.magnitude, 2.33)
+
+        f.set_property('density', 2.4 * units('g/cm^3'))
+        f.set_property('band_gap', 1.12 * units.eV, 'eV')
+        assert np.isclose(f.get_property('density').magnitude, 2.4)
+        assert f.get_property('band_gap').units == units.eV
+        assert set(f.get_properties()) == set(f.list_properties())
@@ -0,0 +1,74 @@
+from cslib import (units, DCS)
+from cslib.datafile import datafile
+from cslib.datafile_collection import (datafile_collection, datafile_index)
+import numpy as np
+import os
+
+
+def write_material(filename, name, e_max):
+    energy = np.logspace(0, np.log10(e_max), 40) * units.eV
+    q = np.linspace(0, 1, 20) * units('1/nm')
+    cs = np.random.random((40, 20)) * units('nm^2 * nm')
+    with datafile(filename, 'w') as f:
+        f.set_property('name', name)
+        f.set_property('density', 2.0 * units('g/cm^3'))
+        DCS(energy, q, cs).save(f.create_group('elastic'))
+    return cs
+
+
+def test_collection(tmpdir):
+    tables = {}
+    for i, (name, e_max) in enumerate([('Si', 1e4), ('Au', 1e3),
+                                       ('PMMA', 1e5)]):
+        filename = str(tmpdir.join('{}.h5'.format(name)))
+        tables[filename] = write_material(filename, name, e_max)
+    with open(str(tmpdir.join('notes.txt')), 'w') as f:
+        f.write('not a datafile')
+
+    with datafile_collection.from_directory(str(tmpdir),
+                                            max_workers=2) as db:
+        assert sorted(db.manifest) == sorted(tables)
+        assert db.find('elastic/cs') == db.filenames
+
+        for filename, cs in tables.items():
+            manifest = db.manifest[filename]
+            assert manifest['properties']['name'] in ('Si', 'Au', 'PMMA')
+            entry = manifest['datasets']['elastic/cs']
+            assert entry['shape'] == (40, 20)
+            assert entry['scales'] == ['energy', 'q']
+            assert not entry['is_scale']
+            assert manifest['datasets']['elastic/energy']['is_scale']
+
+        items = [(filename, 'elastic/cs') for filename in tables]
+        for (filename, _), cs in zip(items, db.get_datasets(items)):
+            assert np.array_equal(cs.magnitude, tables[filename].magnitude)
+
+
+def test_index(tmpdir):
+    directory = str(tmpdir)
+    for name, e_max in [('Si', 1e4), ('Au', 1e3), ('PMMA', 1e5)]:
+        write_material(os.path.join(directory, name + '.h5'), name, e_max)
+
+    index = datafile_index(directory)
+    assert sorted(index.update()) == ['Au.h5', 'PMMA.h5', 'Si.h5']
+    assert index.update() == []
+
+    index = datafile_index(directory)
+    assert index.update() == []
+    assert index.properties('Au.h5')['name'] == 'Au'
+    assert index.properties('Au.h5')['density'].units == \
+        units('g/cm^3').units
+
+    covering = index.find('elastic/cs', {
+        'energy': (1 * units.eV, 10 * units.keV)})
+    assert [os.path.basename(f) for f in covering] == ['PMMA.h5', 'Si.h5']
+    assert index.find('elastic/cs', {
+        'energy': (0.5 * units.eV, 1 * units.keV)}) == []
+    assert index.find('inelastic/cs') == []
+
+    write_material(os.path.join(directory, 'Au.h5'), 'Au', 1e5)
+    os.remove(os.path.join(directory, 'Si.h5'))
+    assert index.update() == ['Au.h5']
+    assert sorted(index.entries) == ['Au.h5', 'PMMA.h5']
+    assert len(index.find('elastic/cs', {
+        'energy': (1 * units.eV, 10 * units.keV)})) == 2
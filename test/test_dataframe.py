@@ -0,0 +1,140 @@
+import io
+
+import pytest
+
+from cslib import (units, DataFrame)
+from cslib.datafile import datafile
+import numpy as np
+
+
+def make_frame(n=100):
+    data = np.zeros(n, dtype=[('energy', float), ('cs', float),
+                              ('weight', float)])
+    data['energy'] = np.logspace(0, 4, n)
+    data['cs'] = 1 / data['energy']
+    data['weight'] = 1
+    return DataFrame(data, ['eV', 'nm^2', 'dimensionless'], ['elsepa'])
+
+
+def test_column_views():
+    for df in [make_frame(), make_frame().to_columns()]:
+        energy = df['energy']
+        assert energy.units == units.eV
+        assert np.shares_memory(energy.magnitude, df._array('energy'))
+        before = df._array('energy').copy()
+        with pytest.raises(ValueError):
+            energy.ito(units.keV)
+        with pytest.raises(ValueError):
+            df['energy'] *= 2
+        assert energy.units == units.eV
+        assert np.array_equal(df._array('energy'), before)
+        assert np.allclose(df['energy'].to(units.keV).magnitude,
+                           before / 1000)
+        assert np.allclose(df[5:10, 1].magnitude,
+                           df['cs'].magnitude[5:10])
+
+        rows = df[10:20]
+        assert len(rows) == 10
+        assert rows.comments == ['elsepa']
+        assert rows.units == df.units
+        assert np.shares_memory(rows['cs'].magnitude, df['cs'].magnitude)
+        assert np.array_equal(rows['energy'].magnitude,
+                              df['energy'].magnitude[10:20])
+
+        row = df[2]
+        assert len(row) == 1
+        assert row.names == df.names
+        assert row['energy'][0] == df['energy'][2]
+        assert df[-1]['cs'][0] == df['cs'][-1]
+        assert len(df[3, 0:2]) == 1
+        with pytest.raises(IndexError):
+            df[len(df)]
+
+        subset = df[::2, 0:2]
+        assert subset.names == ['energy', 'cs']
+        assert len(subset) == 50
+        assert subset.comments == ['elsepa']
+
+
+def test_column_store():
+    df = make_frame()
+    columns = DataFrame.from_columns([('energy', df['energy']),
+                                      ('cs', df['cs'].to('Å^2'))])
+    assert columns.names == ['energy', 'cs']
+    assert columns['energy'].magnitude.flags.c_contiguous
+    assert not np.shares_memory(columns['energy'].magnitude,
+                                df['energy'].magnitude)
+    assert np.array_equal(columns.data['energy'], df.data['energy'])
+    assert str(columns).startswith('# energy (eV), cs (Å ** 2)')
+
+
+def test_from_text():
+    df = make_frame()
+    text = '# ELSEPA output\n' + str(df)
+    for chunk_size in [None, 1, 7]:
+        result = DataFrame.from_text(io.StringIO(text),
+                                     chunk_size=chunk_size)
+        assert result.names == df.names
+        assert result.units == df.units
+        assert result.comments == ['ELSEPA output']
+        assert np.allclose(result['energy'].magnitude,
+                           df['energy'].magnitude, rtol=1e-4)
+
+    csv = '# energy (eV), cs (nm ** 2)\n1, 2\n3, 4\n'
+    result = DataFrame.from_text(io.StringIO(csv), delimiter=',')
+    assert np.array_equal(result['cs'].magnitude, [2, 4])
+
+    with pytest.raises(ValueError):
+        DataFrame.from_text(io.StringIO('1 2\n'))
+    with pytest.raises(ValueError):
+        DataFrame.from_text(io.StringIO('# energy eV\n1\n'))
+
+
+def test_datafile(tmp_path):
+    df = make_frame()
+    with datafile(str(tmp_path / 'frame.h5'), 'w') as f:
+        df.to_datafile(f.create_group('frame'), compression='gzip')
+
+    with datafile(str(tmp_path / 'frame.h5'), 'r') as f:
+        group = f.get_group('frame')
+        assert group.group['cs'].chunks is not None
+        result = DataFrame.from_datafile(group)
+        assert result.names == df.names
+        assert result.units == df.units
+        assert result.comments == ['elsepa']
+        assert np.array_equal(result.data, df.data)
+
+        result = DataFrame.from_datafile(group, ['cs', 'energy'],
+                                         slice(10, 20))
+        assert result.names == ['cs', 'energy']
+        assert np.array_equal(result['cs'].magnitude,
+                              df['cs'].magnitude[10:20])
+
+        with pytest.raises(ValueError):
+            DataFrame.from_datafile(group, ['sigma'])
+
+
+def test_queries():
+    data = np.zeros(6, dtype=[('material', float), ('energy', float)])
+    data['material'] = [3, 1, 3, 2, 1, 3]
+    data['energy'] = [10, 20, 30, 40, 50, 60]
+    df = DataFrame(data, ['dimensionless', 'eV'])
+
+    mask = df.between('energy', 20 * units.eV, 0.05 * units.keV)
+    assert np.array_equal(df[mask]['energy'].magnitude, [20, 30, 40])
+
+    assert np.array_equal(df.sort_by('material')['energy'].magnitude,
+                          [20, 50, 40, 10, 30, 60])
+    assert np.array_equal(
+        df.sort_by('material', reverse=True)['energy'].magnitude,
+        [10, 30, 60, 40, 20, 50])
+
+    groups = df.groupby('material')
+    assert np.array_equal(groups.keys, [1, 2, 3])
+    assert np.array_equal(groups.counts(), [2, 1, 3])
+    total = groups.sum()
+    assert total.names == ['material', 'energy']
+    assert total['energy'].units == units.eV
+    assert np.array_equal(total['energy'].magnitude, [70, 40, 100])
+    assert np.allclose(groups.mean()['energy'].magnitude, [35, 40, 100 / 3])
+    assert np.array_equal(groups.max()['energy'].magnitude, [50, 40, 60])
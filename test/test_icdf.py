@@ -1,4 +1,4 @@
-from cslib.numeric import inverse_cdf_table
+from cslib.numeric import (inverse_cdf_table, inverse_cdf)
 from numpy import (sin, cos, exp, pi, arccos)
 import numpy as np
 
@@ -10,3 +10,39 @@ def test_sine_distribution():
     error = sum((y - arccos(1 - 2*x))**2)
     assert error < 1e-16
 
+
+
+def test_sine_distribution_grid():
+    icdf_table = inverse_cdf_table(sin, 0, pi, 33, n_grid=1025)
+    x = icdf_table[:, 0]
+    y = icdf_table[:, 1]
+    error = sum((y - arccos(1 - 2*x))**2)
+    assert error < 1e-16
+
+
+def test_inverse_cdf_rows():
+    k = np.arange(1, 4)[:, None]
+    table = inverse_cdf_table(lambda x: k * sin(x)**k, 0, pi, 17,
+                              n_grid=1001)
+    assert table.shape == (3, 17, 2)
+
+    for i in range(3):
+        row = inverse_cdf_table(lambda x: sin(x)**(i + 1), 0, pi, 17,
+                                n_grid=1001)
+        assert np.allclose(table[i], row)
+
+    x = np.linspace(0, pi, 1001)
+    _, total = inverse_cdf(x, np.array([sin(x), 2*sin(x)]), [0.5])
+    assert np.allclose(total, [2, 4])
+
+
+def test_inverse_cdf_zero_rows():
+    x = np.linspace(0, pi, 1001)
+    zero = np.zeros_like(x)
+    p = np.linspace(0, 1, 5)
+    icdf, total = inverse_cdf(
+        x, np.array([sin(x), zero, sin(x), zero, sin(x), sin(x)]), p)
+    assert np.array_equal(total == 0, [False, True] * 2 + [False] * 2)
+    assert np.all(np.isnan(icdf[[1, 3]]))
+    for row in [0, 2, 4, 5]:
+        assert np.allclose(icdf[row], arccos(1 - 2*p), atol=1e-4)
@@ -0,0 +1,146 @@
+import os
+import shutil
+
+import numpy as np
+
+from cslib import (units, DataFrame, Settings)
+from cslib.noodles import (registry, ResultCache)
+from cslib.numeric import loglog_interpolate
+
+from test_cs_table import make_dcs
+
+
+def test_quantity(tmp_path):
+    reg = registry(str(tmp_path), inline_bytes=1024)
+    for q in [3 * units.eV, np.float64(2) * units.nm,
+              units.Quantity(np.arange(4.0), 'eV'),
+              units.Quantity(np.arange(1000.0), 'eV')]:
+        result = reg.from_json(reg.to_json(q))
+        assert result.units == q.units
+        assert np.array_equal(result.magnitude, q.magnitude)
+
+    assert reg.from_json(reg.to_json(units.eV)) == units.eV
+    assert len(list(tmp_path.iterdir())) == 1
+
+
+def test_inline_by_default(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    reg = registry()
+    dcs = make_dcs()
+    result = reg.from_json(reg.to_json(dcs))
+    assert np.array_equal(result.cs.magnitude, dcs.cs.magnitude)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_out_of_band(tmp_path):
+    reg = registry(str(tmp_path), inline_bytes=1024)
+    dcs = make_dcs()
+    text = reg.to_json(dcs)
+    assert len(text) < dcs.cs.magnitude.nbytes
+    result = reg.from_json(text)
+    assert result.cs.units == dcs.cs.units
+    assert np.array_equal(result.cs.magnitude, dcs.cs.magnitude)
+    assert np.array_equal(result.energy.magnitude, dcs.energy.magnitude)
+
+    data = np.zeros(1000, dtype=[('energy', float), ('cs', float)])
+    data['energy'] = np.arange(1000)
+    df = DataFrame(data, ['eV', 'nm^2'], ['elsepa'])
+    result = reg.from_json(reg.to_json(df))
+    assert result.units == df.units
+    assert result.comments == ['elsepa']
+    assert np.array_equal(result.data, df.data)
+
+
+def test_result_cache(tmp_path):
+    calls = []
+
+    def scale(settings, energy):
+        calls.append(energy)
+        return energy * settings.factor
+
+    cached = ResultCache(scale, str(tmp_path), max_bytes=28000)
+    settings = Settings(factor=2)
+    energy = np.arange(1000.0) * units.eV
+
+    result = cached(settings, energy)
+    assert np.array_equal(result.magnitude, 2 * energy.magnitude)
+    assert np.array_equal(cached(settings, energy.copy()).magnitude,
+                          result.magnitude)
+    assert len(calls) == 1
+    assert cached.cache_info().hits == 1
+
+    cached(Settings(factor=3), energy)
+    cached(settings, energy + 1 * units.eV)
+    assert len(calls) == 3
+
+    # The least recently used result is evicted first
+    cached(settings, energy)
+    cached(settings, energy - 1 * units.eV)
+    info = cached.cache_info()
+    assert info.size == 3
+    assert info.nbytes <= info.max_bytes
+    cached(settings, energy)
+    assert len(calls) == 4
+    cached(Settings(factor=3), energy)
+    assert len(calls) == 5
+
+    cached.cache_clear()
+    cached(settings, energy)
+    assert len(calls) == 6
+
+    assert cached.key(settings, np.array(3.0)) != \
+        cached.key(settings, np.array([3.0]))
+
+
+def test_result_cache_callable_object(tmp_path):
+    x = np.logspace(0, 3, 10) * units.eV
+    interpolator = loglog_interpolate(x, x.magnitude**2 * units('nm^2'))
+    cached = ResultCache(interpolator, str(tmp_path), version=1)
+    assert 'log_x' not in vars(cached)
+    assert cached.name == 'cslib.numeric.LogLogInterpolator:1'
+
+    E = np.array([2.0, 20.0]) * units.eV
+    assert np.allclose(cached(E).magnitude, interpolator(E).magnitude)
+    assert np.allclose(cached(E).magnitude, interpolator(E).magnitude)
+    assert cached.cache_info().hits == 1
+
+
+def test_dcs_restore(tmp_path):
+    reg = registry(str(tmp_path))
+    dcs = make_dcs()
+    result = reg.from_json(reg.to_json(dcs))
+    assert result._interpolate_fn is None
+    assert result._log_energy_step == dcs._log_energy_step
+    assert not result.energy.magnitude.flags.writeable
+    assert not result._log_energy.flags.writeable
+
+    E = np.linspace(20, 5000, 50) * units.eV
+    q = np.linspace(0, 4, 50) * units('1/nm')
+    assert np.array_equal(result(E, q).magnitude, dcs(E, q).magnitude)
+    assert np.allclose(result.interpolate_fn((np.log(E.magnitude),
+                                              q.magnitude)),
+                       dcs.interpolate_fn((np.log(E.magnitude),
+                                           q.magnitude)))
+
+
+def test_result_cache_concurrent_removal(tmp_path, monkeypatch):
+    cached = ResultCache(lambda x: x, str(tmp_path), max_bytes=0)
+    cached(np.arange(1000.0))
+    cached(np.arange(2000.0))
+
+    # Another process removes the entries after they were listed
+    scandir = os.scandir
+
+    def removing_scandir(path='.'):
+        if path != str(tmp_path):
+            return scandir(path)
+        entries = list(scandir(path))
+        monkeypatch.setattr(os, 'scandir', scandir)
+        for entry in entries:
+            shutil.rmtree(entry.path)
+        monkeypatch.setattr(os, 'scandir', removing_scandir)
+        return iter(entries)
+
+    monkeypatch.setattr(os, 'scandir', removing_scandir)
+    assert cached.cache_info().size == 0
+    assert np.array_equal(cached(np.arange(3000.0)), np.arange(3000.0))
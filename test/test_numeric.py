@@ -0,0 +1,142 @@
+from cslib import units
+from cslib.numeric import (
+    loglog_interpolate, LogLogInterpolator, interpolate_f, log_interpolate_f,
+    ArrayCache, memoize)
+from scipy.interpolate import interp1d
+import numpy as np
+import pytest
+
+
+def test_loglog_interpolate():
+    x = np.logspace(0, 3, 20) * units.eV
+    y = x.magnitude**-1.5 * (2 + np.sin(x.magnitude)) * units('nm^2')
+    f = loglog_interpolate(x, y)
+    assert isinstance(f, LogLogInterpolator)
+
+    ref = interp1d(np.log(x.magnitude), np.log(y.magnitude),
+                   fill_value='extrapolate')
+    points = np.logspace(-1, 4, 1000)
+    expected = np.exp(ref(np.log(points)))
+
+    assert np.allclose(f(points * units.eV).magnitude, expected)
+    assert np.allclose(f((points * units.eV).to('keV')).magnitude, expected)
+    assert np.allclose(f.evaluate(points), expected)
+
+
+def test_loglog_bounds():
+    x = np.array([1., 2., 4.]) * units.eV
+    y = np.array([1., 4., 16.]) * units.nm
+    points = np.array([0.5, 3, 8]) * units.eV
+
+    f = loglog_interpolate(x, y, bounds_error=False, fill_value=0)
+    assert np.allclose(f(points).magnitude, [0, 9, 0])
+
+    f = loglog_interpolate(x, y, fill_value=0)
+    with pytest.raises(ValueError):
+        f(points)
+    assert np.allclose(f(points[1:2]).magnitude, [9])
+
+
+def test_interpolate_f_evaluates_where_needed():
+    calls = []
+
+    def counted(name, f):
+        def g(x):
+            calls.append((name, len(x)))
+            return f(x)
+        return g
+
+    f1 = counted('f1', lambda E: E.to('eV').magnitude**2 * units('nm^2'))
+    f2 = counted('f2', lambda E: 4e4 * E.to('keV').magnitude * units('Å^2'))
+    a, b = 10 * units.eV, 100 * units.eV
+
+    def smooth(u):
+        return 3*u**2 - 2*u**3
+
+    E = np.logspace(0, 3, 31) * units.eV
+    for blend, u in [
+            (interpolate_f, ((E - a) / (b - a)).magnitude),
+            (log_interpolate_f, np.log(E / a).magnitude / np.log(b / a))]:
+        calls.clear()
+        result = blend(f1, f2, smooth, a, b)(E)
+
+        y1 = E.magnitude**2
+        y2 = 4e4 * E.magnitude / 1e3 / 100
+        w = smooth(np.clip(u, 0, 1))
+        expected = np.where(u < 0, y1, np.where(u > 1, y2,
+                            (1 - w) * y1 + w * y2))
+
+        assert result.units == units('nm^2')
+        assert np.allclose(result.magnitude, expected)
+        assert calls == [('f1', 21), ('f2', 21)]
+
+    scalar = interpolate_f(f1, f2, smooth, a, b)(1 * units.keV)
+    assert np.allclose(scalar.to('nm^2').magnitude, 400)
+
+    for blend in [interpolate_f, log_interpolate_f]:
+        empty = blend(f1, f2, smooth, a, b)(np.zeros(0) * units.eV)
+        assert empty.shape == (0,)
+        assert empty.units == units('nm^2')
+
+    # Nested blends hand on plain arrays; the units still follow f1
+    inner = interpolate_f(f1, f2, smooth, a, b)
+    nested = log_interpolate_f(inner, f2, smooth, 1 * units.keV,
+                               2 * units.keV)
+    result = nested(E)
+    assert result.units == units('nm^2')
+    assert np.allclose(result.magnitude, inner(E).magnitude)
+    nested = log_interpolate_f(f2, inner, smooth, 1 * units.eV,
+                               2 * units.eV)
+    assert nested(E).units == units('Å^2')
+    assert np.allclose(nested(E[4:]).to('nm^2').magnitude,
+                       inner(E[4:]).magnitude)
+
+    # A function used on every point gets the input without a copy
+    seen = []
+
+    def f3(x):
+        seen.append(np.shares_memory(x.magnitude, E.magnitude))
+        return f1(x)
+
+    interpolate_f(f3, f2, smooth, 2 * units.keV, 3 * units.keV)(E)
+    assert seen == [True]
+
+
+def test_memoize():
+    calls = []
+
+    @memoize(max_bytes=2 * 8 * 100)
+    def f(E, scale=1):
+        calls.append(E)
+        return E.to('eV').magnitude * scale * units('nm^2')
+
+    E = np.linspace(1, 100, 100) * units.eV
+    first = f(E)
+    assert f(np.linspace(1, 100, 100) * units.eV) is first
+    assert f(E.to('keV')) is not first
+    assert f(E, scale=2) is not first
+    assert len(calls) == 3
+
+    info = f.cache_info()
+    assert (info.hits, info.misses, info.size) == (1, 3, 2)
+    assert info.nbytes == 2 * 8 * 100
+
+    f(E)
+    assert len(calls) == 4
+    assert not first.magnitude.flags.writeable
+
+    # Neither the state of a wrapped object nor its arrays are touched
+    x = np.logspace(0, 3, 10) * units.eV
+    interpolator = loglog_interpolate(x, x.magnitude**2 * units('nm^2'))
+    cached = ArrayCache(interpolator)
+    assert 'log_x' not in vars(cached)
+
+    table = np.arange(10.0)
+    lookup = ArrayCache(lambda: table)
+    assert not np.shares_memory(lookup(), table)
+    assert table.flags.writeable
+
+    # A 0-d array is not the same key as a 1-d array of one element
+    double = ArrayCache(lambda a: 2 * a)
+    assert double(np.array([3.0])).shape == (1,)
+    assert double(np.array(3.0)).shape == ()
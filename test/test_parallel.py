@@ -0,0 +1,47 @@
+from cslib import (units, DCS)
+from cslib.parallel import (tabulate, tabulate_dcs, _SharedDCS)
+import numpy as np
+import pickle
+
+
+def screened_rutherford(E, q):
+    return (E.magnitude / (q.magnitude**2 + 1)**2) * units('nm^3')
+
+
+def test_tabulate_dcs_identical():
+    energy = np.logspace(1, 4, 101) * units.eV
+    q = np.linspace(0, 10, 51) * units('1/nm')
+    serial = DCS(energy, q, screened_rutherford(energy.reshape(-1, 1), q))
+
+    for kwargs in [{'max_workers': 3}, {'max_workers': 3,
+                                        'use_threads': True}]:
+        result = tabulate_dcs(screened_rutherford, energy, q, **kwargs)
+        assert result.cs.units == serial.cs.units
+        assert np.array_equal(result.cs.magnitude, serial.cs.magnitude)
+
+        resampled = tabulate_dcs(serial, energy[5:-5], q[::2], **kwargs)
+        assert np.array_equal(
+            resampled.cs.magnitude,
+            serial.evaluate(energy[5:-5], q[::2], grid=True))
+
+
+def test_tabulate_1d():
+    energy = np.logspace(1, 4, 11) * units.eV
+    result = tabulate(np.sqrt, energy, max_workers=2)
+    assert np.array_equal(result.magnitude, np.sqrt(energy.magnitude))
+
+
+def test_shared_dcs():
+    # A DCS goes to process workers without its table; the results are
+    # checked in test_tabulate_dcs_identical.
+    energy = np.logspace(1, 4, 201) * units.eV
+    q = np.linspace(0, 10, 201) * units('1/nm')
+    dcs = DCS(energy, q, screened_rutherford(energy.reshape(-1, 1), q))
+
+    shared = []
+    try:
+        assert len(pickle.dumps(_SharedDCS(dcs, shared))) < 2000
+    finally:
+        for shm in shared:
+            shm.close()
+            shm.unlink()
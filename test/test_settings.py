@@ -0,0 +1,45 @@
+import pickle
+
+import pytest
+
+from cslib import (Settings, Model, Type, units)
+
+
+def make_settings():
+    model = Model(
+        seed=Type('Random seed.', default=42),
+        n=Type('Number of events.', default=lambda s: s.beam.count * 2),
+        offset=Type('Seed offset.', default=lambda s: s.seed + 1))
+    settings = Settings(_model=model)
+    settings.beam.energy = 10 * units.keV
+    settings.beam.count = 5
+    settings['detector-name'] = 'sem'
+    return settings
+
+
+def test_freeze():
+    settings = make_settings()
+    frozen = settings.freeze()
+
+    assert frozen.beam.energy == 10 * units.keV
+    assert frozen['beam.energy'] is frozen.beam.energy
+    assert frozen['detector-name'] == 'sem'
+    assert frozen.seed == 42
+    assert frozen.n == 10
+    assert frozen.offset == 43
+    assert 'seed' not in settings
+
+    assert list(frozen) == ['beam', 'detector-name', 'seed', 'n', 'offset']
+    assert 'beam' in frozen
+    assert 'beam.count' not in frozen
+    assert frozen.get('beam.count') == 5
+    assert not hasattr(frozen, '__dict__')
+
+    with pytest.raises(AttributeError):
+        frozen.beam.angle
+    with pytest.raises(AttributeError):
+        frozen.seed = 1
+
+    thawed = frozen.thaw()
+    assert thawed.beam.count == 5
+    assert pickle.loads(pickle.dumps(frozen)) == frozen